@@ -6,10 +6,14 @@ import time
 from random import randint
 import random
 import copy
+import multiprocessing
+import Queue
+from collections import deque
 from tile import Tile
 from pprint import pprint
 
 from gamestate import Gamestate
+from search import SearchStats
 import fifteen_puzzle_ai
 
 WIDTH = 325
@@ -25,12 +29,43 @@ tilesMoving = False
 
 lastScramble = (0,0)
 
+# the background solve, while one is running. See solve.
+solver = None
+solverResults = None
+solveStartTime = None
+
+# milliseconds between checks on the background solve
+POLL_INTERVAL = 50
+
+# solve_astar_7breaks solves the board in this many stages
+NUM_STAGES = 7
+
+# tile animations waiting to be played, oldest first. Each is a
+# TileAnimation, or a function to call once everything before it has played.
+animations = deque()
+
+# True while next_frame is scheduled
+frameScheduled = False
+lastFrameTime = None
+
+# milliseconds between frames
+FRAME_INTERVAL = 16
+
+# how many times faster than normal animations play
+animationSpeed = 1.0
+
 def init(master):
     global board, canvas
     
     canvas = Canvas(master, width=WIDTH, height=HEIGHT, bg='WHITE')
     canvas.pack()
 
+    # space skips to the end of the animations, f and s speed them up and
+    # slow them down
+    master.bind('<space>', lambda event: skip_animations())
+    master.bind('f', lambda event: change_animation_speed(2.0))
+    master.bind('s', lambda event: change_animation_speed(0.5))
+
     board =[[],[],[],[]]
     for rowindex, row in enumerate(board):
         for i in range(1,5):
@@ -58,9 +93,10 @@ def initboard():
     canvas.create_text((WIDTH - 2*startingx) / 4 + startingx, WIDTH + 20, text='scramble')
 
     canvas.create_rectangle(startingx + (WIDTH - 2*startingx) / 2 + 10, WIDTH, WIDTH - startingx, WIDTH + 40)
-    canvas.create_text((WIDTH - 2*startingx) / 4 * 3 + startingx, WIDTH + 20, text='solve')
+    canvas.create_text((WIDTH - 2*startingx) / 4 * 3 + startingx, WIDTH + 20, text='solve', tag='solvetext')
     canvas.bind('<Button-1>', clicked)
     canvas.create_text(WIDTH/2, 400, text = "", tag = "boardtext")
+    canvas.create_rectangle(startingx, 415, startingx, 420, fill='gray', outline='', tag='progress')
 
 
 def change_board_text(text):
@@ -78,20 +114,29 @@ def clicked(event):
         scramble(20)
 
     if r == 4 and c >= 2 and c < 4:
-        solve()
+        if solver is None:
+            solve()
+        else:
+            cancel_solve()
         #pizza()
 
-    #Clicked a tile
-    if r < len(board) and r >= 0 and c < len(board[0]) and c >= 0:
+    #Clicked a tile, but not while the solver is working on the board
+    if solver is None and r < len(board) and r >= 0 and c < len(board[0]) and c >= 0:
         #didn't click empty tile
         if not board[r][c] == None and (r,c) in getNeighbors(getBlankLocation()):
             makeMove((r, c), .2)
 
 def makeMove((r, c), secondsToMove):
     """
+    Move the tile at (r, c) into the blank.
+
+    The board changes right away, so the next move can be made from it, but
+    the tile is only drawn moving once the animations queued before it have
+    played (see next_frame).
+
     parameters:
     r, c -- position to move blank tile to
-    secondsToMove -- ...
+    secondsToMove -- how long the tile takes to slide, at normal speed
     """
     blankRow, blankCol = getBlankLocation()
     x, y = blankCol - c, blankRow - r
@@ -100,29 +145,98 @@ def makeMove((r, c), secondsToMove):
     board[r][c] = None
     board[r+y][c+x] = temptile
 
-    r += y
-    c += x
-
-    starttime = time.time()
-    prevtime = starttime
-    now = prevtime + .00000001 # don't divide by zero
-    dx = 0
-    tilenumber = str(board[r][c].getNumber())
-
-    while(now - starttime < secondsToMove):
-        now = time.time()
-        dt = now - prevtime
-        move = sqlength/(secondsToMove/dt)
-        
-        if dx + move > sqlength:
-            move = sqlength - dx
-        dx += sqlength/(secondsToMove/dt)
-
-        canvas.move('tile'+tilenumber, move * x, move * y)
-        canvas.move('text'+tilenumber, move * x, move * y)
-        
-        prevtime = now
-        canvas.update()
+    queue_animation(TileAnimation(temptile.getNumber(), x, y, secondsToMove))
+
+class TileAnimation(object):
+    """
+    A tile sliding one square in direction (x, y), which is a unit vector.
+    done is the fraction of the slide drawn so far.
+    """
+
+    def __init__(self, number, x, y, seconds):
+        self.number = number
+        self.x = x
+        self.y = y
+        self.seconds = seconds
+        self.done = 0.0
+
+    def advance(self, fraction):
+        """
+        Draw fraction more of the slide.
+        """
+        move = sqlength * fraction
+        canvas.move('tile'+str(self.number), move * self.x, move * self.y)
+        canvas.move('text'+str(self.number), move * self.x, move * self.y)
+        self.done += fraction
+
+def queue_animation(animation):
+    """
+    Add a TileAnimation, or a function to call when the animations before
+    it are done, to the queue, and start playing the queue if it isn't
+    already.
+    """
+    global frameScheduled, lastFrameTime
+
+    animations.append(animation)
+
+    if not frameScheduled:
+        frameScheduled = True
+        lastFrameTime = time.time()
+        canvas.after(FRAME_INTERVAL, next_frame)
+
+def next_frame():
+    """
+    Draw one frame, then schedule the next one unless the queue is empty.
+
+    Frames come every FRAME_INTERVAL milliseconds, and each one advances
+    the animations by however much time really passed (times
+    animationSpeed). Time left over when a tile arrives goes to the next
+    one, so a long sequence of moves takes as long as its moves add up to
+    however late the frames are.
+    """
+    global frameScheduled, lastFrameTime
+
+    now = time.time()
+    seconds = (now - lastFrameTime) * animationSpeed
+    lastFrameTime = now
+
+    while animations:
+        animation = animations[0]
+
+        if not isinstance(animation, TileAnimation):
+            animations.popleft()
+            animation()
+            continue
+
+        if seconds <= 0:
+            break
+
+        fraction = min(1 - animation.done, seconds / animation.seconds)
+        seconds -= fraction * animation.seconds
+        animation.advance(fraction)
+
+        if animation.done >= 1 - 1e-9:
+            animations.popleft()
+
+    if animations:
+        canvas.after(FRAME_INTERVAL, next_frame)
+    else:
+        frameScheduled = False
+
+def skip_animations():
+    """
+    Finish every queued animation now.
+    """
+    while animations:
+        animation = animations.popleft()
+        if isinstance(animation, TileAnimation):
+            animation.advance(1 - animation.done)
+        else:
+            animation()
+
+def change_animation_speed(factor):
+    global animationSpeed
+    animationSpeed = min(64.0, max(0.25, animationSpeed * factor))
 
 def scramble(num_moves=100):
     global tilesMoving
@@ -136,10 +250,26 @@ def scramble(num_moves=100):
     lastScramble = None
     for i in range(num_moves):
         lastScramble = move_random(lastScramble)
-    
+
+    queue_animation(finish_scramble)
+
+def finish_scramble():
+    """
+    Called once the scramble has finished playing.
+    """
+    global tilesMoving
+
     change_board_text("")
     tilesMoving = False
 
+def finish_playback():
+    """
+    Called once a solution has finished playing.
+    """
+    global tilesMoving
+
+    tilesMoving = False
+
 def move_random(lastScramble=None):
     """
     1. find blank location
@@ -177,7 +307,16 @@ def isLegalPosition((row, col)):
     return 0 <= row <= 3 and 0 <= col <= 3
 
 def solve():
-    global tilesMoving
+    """
+    Start solving the board in a background process. The Tk main loop keeps
+    running: poll_solve checks on the solver every POLL_INTERVAL
+    milliseconds, shows its progress, and plays the solution back when it
+    arrives. Meanwhile the solve button cancels the search.
+
+    A process rather than a thread, because a thread running the search
+    would hold the GIL and stall the window anyway.
+    """
+    global tilesMoving, solver, solverResults, solveStartTime
     
     if tilesMoving:
         return
@@ -185,24 +324,110 @@ def solve():
         tilesMoving = True
     
     change_board_text("solving...")
-    canvas.update()
+    canvas.itemconfig('solvetext', text='cancel')
 
-    nums = board_to_nums()
-    start_state = Gamestate(nums)
-    
-    start_time = time.time()
-    actions = fifteen_puzzle_ai.solve_astar_7breaks(start_state)
-    elapsed_time = time.time() - start_time
+    solverResults = multiprocessing.Queue()
+    solver = multiprocessing.Process(target=solve_worker, args=(board_to_nums(), solverResults))
+    solver.daemon = True
+    solveStartTime = time.time()
+    solver.start()
 
-    pizza()
+    canvas.after(POLL_INTERVAL, poll_solve)
 
-    change_board_text("solved in %d moves (%.2f seconds)" % (len(actions), elapsed_time))
+def solve_worker(nums, results):
+    """
+    Runs in the solver process. Put ('progress', stage, nodes) messages on
+    the results queue while searching, then ('solved', actions) or
+    ('error', message).
+    """
+    def report(stats):
+        results.put(('progress', len(stats.stages) + 1, stats.expanded))
 
-    for action in actions:
-        makeMove(action, 0.15)
+    try:
+        stats = SearchStats(callback=report, interval=2000)
+        actions = fifteen_puzzle_ai.solve_astar_7breaks(Gamestate(nums), stats=stats)
+        results.put(('solved', actions))
+    except Exception as e:
+        results.put(('error', "%s: %s" % (type(e).__name__, e)))
 
+def poll_solve():
+    """
+    Handle whatever the solver has sent since the last poll.
+    """
+    global tilesMoving
+
+    if solver is None:
+        # cancelled
+        return
+
+    elapsed_time = time.time() - solveStartTime
+
+    # check before reading the queue: a worker that has exited has already
+    # flushed its result into it, so the reads below still see the result
+    finished = not solver.is_alive()
+
+    try:
+        while True:
+            message = solverResults.get_nowait()
+
+            if message[0] == 'progress':
+                stage, nodes = message[1:]
+                change_board_text("solving... stage %d of %d, %d nodes (%.1f seconds)" %
+                                  (stage, NUM_STAGES, nodes, elapsed_time))
+                set_progress(float(stage - 1) / NUM_STAGES)
+                continue
+
+            finish_solve()
+            if message[0] == 'error':
+                change_board_text(message[1])
+                tilesMoving = False
+                return
+
+            actions = message[1]
+            pizza()
+            change_board_text("solved in %d moves (%.2f seconds)" % (len(actions), elapsed_time))
+
+            for action in actions:
+                makeMove(action, 0.15)
+
+            # the message stays up after the solution has played
+            queue_animation(finish_playback)
+            return
+    except Queue.Empty:
+        pass
+
+    if finished:
+        # died without a word, e.g. killed
+        finish_solve()
+        change_board_text("solver stopped unexpectedly")
+        tilesMoving = False
+        return
+
+    canvas.after(POLL_INTERVAL, poll_solve)
+
+def cancel_solve():
+    global tilesMoving
+
+    solver.terminate()
+    finish_solve()
+    change_board_text("cancelled")
     tilesMoving = False
 
+def finish_solve():
+    global solver, solverResults
+
+    solver.join()
+    solver = None
+    solverResults = None
+    canvas.itemconfig('solvetext', text='solve')
+    set_progress(0)
+
+def set_progress(fraction):
+    """
+    Fill fraction of the progress bar under the board text.
+    """
+    canvas.coords('progress', startingx, 415, startingx + fraction * (WIDTH - 2*startingx), 420)
+
 def board_to_nums():
     board_ = []
     for r in range(4):
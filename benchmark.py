@@ -0,0 +1,382 @@
+
+__author__ = "Josh Kelle"
+
+"""
+Benchmarks of the solvers.
+
+Every strategy in BENCHMARKS is run over a fixed corpus of boards: seeded
+random scrambles at a few depths, plus (optionally) boards read from a file
+such as Korf's 100 instances. Each run happens in a fresh process, so its
+peak memory can be measured, and is cut off after a timeout. Results are
+written as JSON, and can be compared against a stored baseline to catch
+regressions:
+
+    % python benchmark.py --output baseline.json
+    % python benchmark.py --baseline baseline.json
+"""
+
+import search
+import fifteen_puzzle_ai
+from fifteen_puzzle_ai import SolveTimeout
+from gamestate import Gamestate, shape_4x4
+from profiler import SamplingProfiler
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import signal
+import sys
+import time
+
+
+##############
+# strategies #
+##############
+
+# Each strategy is called as strategy(start_state, stats, max_nodes) and
+# returns a list of actions. stats is a search.SearchStats to fill in.
+
+def _astar(heuristic):
+    def solve(start_state, stats, max_nodes):
+        actions, end_state = search.astar(start_state, heuristic, q=True, stats=stats,
+                                          max_nodes=max_nodes, degrade=False)
+        return actions
+    return solve
+
+
+def _staged(solver):
+    def solve(start_state, stats, max_nodes):
+        return solver(start_state, stage_cache=None, stats=stats, max_nodes=max_nodes)
+    return solve
+
+
+def _adaptive(solver):
+    # these budget each stage themselves
+    def solve(start_state, stats, max_nodes):
+        return solver(start_state, stage_cache=None, stats=stats)
+    return solve
+
+
+def _iddfs(start_state, stats, max_nodes):
+    return search.iterative_deepening_dfs(start_state, q=True, stats=stats)
+
+
+BENCHMARKS = {
+    'astar_misplaced':        _astar(search.heuristic_1),
+    'astar_manhattan':        _astar(search.heuristic_3),
+    'astar_linear_conflict':  _astar(search.heuristic_linear_conflict),
+    'astar_walking_distance': _astar(search.heuristic_walking_distance),
+    'solve_astar_7breaks':    _staged(fifteen_puzzle_ai.solve_astar_7breaks),
+    'solve_astar_6breaks':    _staged(fifteen_puzzle_ai.solve_astar_6breaks),
+    'solve_astar_5breaks':    _staged(fifteen_puzzle_ai.solve_astar_5breaks),
+    'solve_astar_4breaks':    _staged(fifteen_puzzle_ai.solve_astar_4breaks),
+    'solve_astar_2breaks':    _staged(fifteen_puzzle_ai.solve_astar_2breaks),
+    'solve_astar_1breaks':    _staged(fifteen_puzzle_ai.solve_astar_1breaks),
+    'solve_adaptive':         _adaptive(fifteen_puzzle_ai.solve_adaptive),
+    'solve_shortened':        _adaptive(fifteen_puzzle_ai.solve_shortened),
+    'iddfs':                  _iddfs,
+}
+
+
+##########
+# corpus #
+##########
+
+def scramble(depth, rng, shape=shape_4x4):
+    """
+    Return a Gamestate made by depth random moves from the goal, never
+    undoing the previous move. rng is a random.Random.
+    """
+    gamestate = Gamestate(shape.goal_grid)
+    prev_blank_loc = None
+
+    for i in range(depth):
+        action = rng.choice(gamestate.get_legal_actions(prev_blank_loc))
+        prev_blank_loc = gamestate.blank_loc
+        gamestate = gamestate.get_successor(action)
+
+    return gamestate
+
+
+def scramble_corpus(depths=(10, 20, 40, 80), count=5, seed=0):
+    """
+    Return a list of (name, Gamestate) pairs, count scrambles at each
+    depth. The same seed always gives the same corpus.
+    """
+    rng = random.Random(seed)
+    return [("scramble-%d-%d" % (depth, i), scramble(depth, rng))
+            for depth in depths for i in range(count)]
+
+
+def korf_gamestate(numbers):
+    """
+    Convert a board in Korf's notation to a Gamestate.
+
+    Korf lists the tile at each cell, with 0 for the blank, and his goal has
+    the blank in the top left. Turning the board upside down and numbering
+    tiles from the other end (tile t becomes 16 - t) maps his goal onto
+    ours, and keeps every solution the same length.
+    """
+    nums = [16 - num for num in reversed(numbers)]
+    return Gamestate([nums[row*4:(row+1)*4] for row in range(4)])
+
+
+def load_corpus(path):
+    """
+    Read boards in Korf's notation from a file, one per line, like the
+    korf100 instances. A line is 16 numbers, or an id followed by 16
+    numbers. Blank lines and lines starting with # are skipped.
+
+    Return a list of (name, Gamestate) pairs.
+    """
+    corpus = []
+    name = os.path.splitext(os.path.basename(path))[0]
+
+    with open(path) as f:
+        for line in f:
+            numbers = [int(word) for word in line.split()]
+            if not numbers or line.lstrip().startswith('#'):
+                continue
+            if len(numbers) == 17:
+                board_id, numbers = numbers[0], numbers[1:]
+            else:
+                board_id = len(corpus) + 1
+            if len(numbers) != 16:
+                raise ValueError("bad line in %s: %r" % (path, line))
+            corpus.append(("%s-%d" % (name, board_id), korf_gamestate(numbers)))
+
+    return corpus
+
+
+###########
+# running #
+###########
+
+def run(corpus, strategies=None, timeout=60, max_nodes=2000000, q=False, profile=False):
+    """
+    Run every strategy on every board of corpus.
+
+    parameters:
+    corpus -- list of (name, Gamestate) pairs
+    strategies -- list of keys of BENCHMARKS. Defaults to all of them.
+    timeout -- seconds allowed per run, or None for no limit
+    max_nodes -- node budget per search (see search.astar). astar
+                 strategies fail when they run out, staged strategies fall
+                 back to IDA* for that stage. The adaptive strategies
+                 have their own budgets.
+    q -- quiet flag. If False, print a line per run.
+    profile -- if True, run each strategy under a SamplingProfiler and
+               include its busiest functions in the results.
+
+    return:
+    A dict, ready for json.dump, with a list of runs and a summary per
+    strategy (see summarize).
+    """
+    strategies = sorted(BENCHMARKS) if strategies is None else strategies
+    for strategy in strategies:
+        if strategy not in BENCHMARKS:
+            raise ValueError("unknown strategy %r, expected one of %s" % (strategy, sorted(BENCHMARKS)))
+
+    tasks = [(strategy, name, tuple(map(tuple, gamestate.grid)), timeout, max_nodes, profile)
+             for strategy in strategies for name, gamestate in corpus]
+
+    # one process per run, so ru_maxrss is the peak of that run alone
+    pool = multiprocessing.Pool(1, _init_worker, maxtasksperchild=1)
+    runs = []
+
+    try:
+        for result in pool.imap(_run_task, tasks):
+            if not q:
+                print "%-24s %-16s %s" % (result['strategy'], result['board'], result['error'] or
+                                          "%d moves in %.3f seconds" % (result['length'], result['seconds']))
+            runs.append(result)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+    return {'timeout': timeout, 'max_nodes': max_nodes, 'runs': runs, 'summary': summarize(runs)}
+
+
+def _init_worker():
+    sys.stdout = open(os.devnull, 'w')
+
+
+def _raise_timeout(signum, frame):
+    raise SolveTimeout()
+
+
+def _run_task((strategy, name, grid, timeout, max_nodes, profile)):
+    """
+    Run a single strategy on a single board in a worker process.
+    Return a dict describing the run.
+    """
+    start_state = Gamestate(grid)
+    stats = search.SearchStats()
+    profiler = SamplingProfiler() if profile else None
+    actions = None
+    error = None
+
+    if timeout is not None:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    start_time = time.time()
+    try:
+        if profiler is not None:
+            profiler.start()
+        actions = BENCHMARKS[strategy](start_state, stats, max_nodes)
+    except SolveTimeout:
+        error = "timed out after %s seconds" % timeout
+    except Exception as e:
+        error = "%s: %s" % (type(e).__name__, e)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        if timeout is not None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    seconds = time.time() - start_time
+
+    if actions is not None:
+        end_state = start_state
+        for action in actions:
+            end_state = end_state.get_successor(action)
+        if not end_state.is_goal_state():
+            error = "solution doesn't reach the goal"
+
+    result = {
+        'strategy': strategy,
+        'board': name,
+        'grid': grid,
+        'seconds': seconds,
+        'expanded': stats.expanded,
+        'generated': stats.generated,
+        'peak_nodes': stats.peak_nodes,
+        # kilobytes on linux
+        'peak_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'length': None if error else len(actions),
+        'error': error,
+        'stats': stats.as_dict(),
+    }
+    if profiler is not None:
+        result['profile'] = profiler.as_dict()
+    return result
+
+
+def summarize(runs):
+    """
+    Return a dict mapping each strategy to totals over its runs. Boards it
+    failed on count towards failed and nothing else.
+    """
+    summary = {}
+
+    for run in runs:
+        totals = summary.setdefault(run['strategy'], {'solved': 0, 'failed': 0, 'seconds': 0.0,
+                                                      'expanded': 0, 'generated': 0, 'length': 0,
+                                                      'peak_rss': 0})
+        if run['error']:
+            totals['failed'] += 1
+            continue
+
+        totals['solved'] += 1
+        for metric in ('seconds', 'expanded', 'generated', 'length'):
+            totals[metric] += run[metric]
+        totals['peak_rss'] = max(totals['peak_rss'], run['peak_rss'])
+
+    return summary
+
+
+#############
+# comparing #
+#############
+
+def compare(results, baseline, tolerance=0.1, min_seconds=0.5):
+    """
+    Compare results against baseline, both as returned by run.
+
+    A strategy regresses when it solves fewer boards, or when its total time,
+    nodes, peak memory or solution length grows by more than tolerance (a
+    fraction). Time also has to grow by more than min_seconds, since
+    quick runs are mostly noise. Only runs on boards solved in both are
+    compared, so a different corpus doesn't show up as a regression.
+
+    Return a list of messages, one per regression.
+    """
+    baseline_runs = dict(((run['strategy'], run['board']), run) for run in baseline['runs'])
+    regressions = []
+
+    for strategy, totals in sorted(summarize(results['runs']).items()):
+        if strategy not in baseline['summary']:
+            continue
+        if totals['solved'] < baseline['summary'][strategy]['solved']:
+            regressions.append("%s: solved %d boards, baseline solved %d" %
+                               (strategy, totals['solved'], baseline['summary'][strategy]['solved']))
+
+        both = [(run, baseline_runs[strategy, run['board']]) for run in results['runs']
+                if run['strategy'] == strategy and not run['error'] and
+                not baseline_runs.get((strategy, run['board']), {'error': True})['error']]
+
+        for metric in ('seconds', 'expanded', 'generated', 'length', 'peak_rss'):
+            if metric == 'peak_rss':
+                new = max([run[metric] for run, old_run in both] or [0])
+                old = max([old_run[metric] for run, old_run in both] or [0])
+            else:
+                new = sum(run[metric] for run, old_run in both)
+                old = sum(old_run[metric] for run, old_run in both)
+
+            if metric == 'seconds' and new - old <= min_seconds:
+                continue
+            if new > old * (1 + tolerance):
+                regressions.append("%s: %s went from %s to %s" % (strategy, metric, old, new))
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the fifteen puzzle solvers.")
+    parser.add_argument('--strategies', help="comma separated keys of BENCHMARKS (default: all)")
+    parser.add_argument('--corpus', action='append', default=[],
+                        help="file of boards in Korf's notation, e.g. korf100.txt. May be repeated.")
+    parser.add_argument('--depths', default='10,20,40,80', help="scramble depths, or '' for none")
+    parser.add_argument('--count', type=int, default=5, help="scrambles per depth")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=60, help="seconds per run")
+    parser.add_argument('--max-nodes', type=int, default=2000000, help="node budget per search")
+    parser.add_argument('--profile', action='store_true',
+                        help="sample each run's call stack and report the busiest functions")
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--baseline', help="compare against results stored in this file")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="fraction a metric may grow by before it's a regression")
+    args = parser.parse_args(argv)
+
+    depths = [int(depth) for depth in args.depths.split(',') if depth]
+    corpus = scramble_corpus(depths, args.count, args.seed)
+    for path in args.corpus:
+        corpus += load_corpus(path)
+
+    strategies = args.strategies.split(',') if args.strategies else None
+    results = run(corpus, strategies, args.timeout, args.max_nodes, profile=args.profile)
+    results['seed'] = args.seed
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    else:
+        json.dump(results['summary'], sys.stdout, indent=2, sort_keys=True)
+        print
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print "REGRESSION", message
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,239 @@
+
+__author__ = "Josh Kelle"
+
+"""
+Exact distance tables, built by a layered breadth first search.
+
+A DistanceTable covers a set of tiles. It only looks at where those tiles
+and the blank are (an abstract state); the other tiles are
+indistinguishable. For every abstract state it knows the fewest moves that
+put its tiles in their correct locations. This is the exact cost of a
+staged solve_astar stage whose targets are the table's tiles. If the blank
+is one of the tiles, it has to end up in its correct location too, so a
+table of every tile on a 3 x 3 board answers exact shortest paths for the
+8-puzzle.
+
+Abstract states are ranked with rank_placement, and each rank gets 2 bits
+holding its distance mod 3 (3 means not reached yet). That is enough to
+tell which neighbor is one move closer to the goal, so exact distances and
+shortest paths are recovered by walking down from a state to a goal.
+"""
+
+from gamestate import shape_4x4, check_solvable, UnsolvableError
+from pattern_database import neighbor_indices
+from ranking import num_placements, rank_placement, unrank_placement
+from array import array
+import mmap
+import os
+import time
+
+UNREACHED = 3
+
+
+class DistanceTable(object):
+
+    """
+    Distances to the goal for every placement of some tiles and the blank.
+    Call it like any other heuristic: table(gamestate, targets).
+    """
+
+    def __init__(self, tiles, data, shape=shape_4x4):
+        """
+        Contructor. Use build or load instead of calling this directly.
+
+        parameters:
+        tiles -- tile numbers covered by the table. If the blank is one of
+                 them, the goal requires the blank in its correct location.
+        data -- a bytearray or mmap of 2-bit entries indexed by rank
+        shape -- the BoardShape the table was built for
+        """
+        self.shape = shape
+        self.tiles = tuple(sorted(num for num in tiles if num != shape.blank))
+        self.fixed_blank = shape.blank in tiles
+        self.data = data
+        self.neighbors = neighbor_indices(shape)
+
+        self.goal = [row * shape.cols + col for row, col in
+                     (shape.correct_locations[num] for num in self.tiles)]
+        row, col = shape.correct_locations[shape.blank]
+        self.blank_goal = row * shape.cols + col
+
+    @classmethod
+    def build(cls, tiles, shape=shape_4x4, directory=None, q=False):
+        """
+        Build the table for tiles by a breadth first search backwards from
+        the goal, one layer at a time. If directory is given, also save the
+        table there (see load).
+
+        Only the current layer is held as a list, as an array of ranks;
+        everything else is in the 2-bit table. Every placement of k tiles
+        and the blank costs a quarter of a byte, so this is practical up to
+        about 6 tiles on a 4 x 4 board (57 million placements, 14 MB), or
+        every tile on a 3 x 3 board.
+        """
+        start_time = time.time()
+        table = cls(tiles, None, shape)
+
+        num_tiles = len(table.tiles) + 1
+        num_cells = shape.size
+        data = bytearray('\xff' * ((num_placements(num_tiles, num_cells) + 3) // 4))
+
+        layer = array('L')
+        for placement in table.goal_placements():
+            rank = rank_placement(placement, num_cells)
+            _set(data, rank, 0)
+            layer.append(rank)
+
+        depth = 0
+        while layer:
+            next_layer = array('L')
+            value = (depth + 1) % 3
+
+            for rank in layer:
+                placement = unrank_placement(rank, num_tiles, num_cells)
+                for moved in table.moves(placement):
+                    moved_rank = rank_placement(moved, num_cells)
+                    if _get(data, moved_rank) == UNREACHED:
+                        _set(data, moved_rank, value)
+                        next_layer.append(moved_rank)
+
+            if not q:
+                print "depth %d: %d states" % (depth, len(layer))
+
+            layer = next_layer
+            depth += 1
+
+        if not q:
+            print "built table for %s in %s seconds" % (tiles, time.time() - start_time)
+
+        if directory is not None:
+            with open(table_path(directory, tiles, shape), 'wb') as f:
+                f.write(data)
+
+        table.data = data
+        return table
+
+    @classmethod
+    def load(cls, directory, tiles, shape=shape_4x4):
+        """
+        Memory-map a table previously saved by build.
+        """
+        with open(table_path(directory, tiles, shape), 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return cls(tiles, data, shape)
+
+    def placement(self, gamestate):
+        """
+        Return the abstract state of gamestate: the board indices of the
+        table's tiles, in order, followed by the blank's board index.
+        """
+        locations = {}
+        for row, nums in enumerate(gamestate.grid):
+            for col, num in enumerate(nums):
+                locations[num] = row * self.shape.cols + col
+
+        return [locations[num] for num in self.tiles + (self.shape.blank,)]
+
+    def goal_placements(self):
+        """
+        Return the list of abstract states which are goals.
+        """
+        if self.fixed_blank:
+            return [self.goal + [self.blank_goal]]
+        return [self.goal + [index] for index in range(self.shape.size) if index not in self.goal]
+
+    def is_goal(self, placement):
+        return placement[:-1] == self.goal and (not self.fixed_blank or placement[-1] == self.blank_goal)
+
+    def moves(self, placement):
+        """
+        Yield the abstract states one move away from placement.
+        """
+        blank_index = placement[-1]
+        for index in self.neighbors[blank_index]:
+            moved = list(placement)
+            if index in placement:
+                moved[placement.index(index)] = blank_index
+            moved[-1] = index
+            yield moved
+
+    def solve(self, gamestate):
+        """
+        Return an (actions, end_state) tuple, same as search.astar, where
+        actions is a shortest sequence of actions that puts the table's
+        tiles in place.
+
+        Raise UnsolvableError if gamestate can't be solved.
+        """
+        check_solvable(gamestate)
+
+        actions = self._walk(self.placement(gamestate))
+        for action in actions:
+            gamestate = gamestate.get_successor(action)
+
+        return actions, gamestate
+
+    def distance(self, gamestate):
+        """
+        Return the fewest moves that put the table's tiles in place.
+
+        Raise UnsolvableError if the table never reached gamestate's
+        abstract state.
+        """
+        return len(self._walk(self.placement(gamestate)))
+
+    def __call__(self, gamestate, targets=None):
+        """
+        Heuristic value of gamestate: the exact distance if all the table's
+        tiles are in targets, otherwise 0 so the value stays admissible.
+        """
+        if targets is not None and not all(num in targets for num in self.tiles):
+            return 0
+        return self.distance(gamestate)
+
+    def _walk(self, placement):
+        """
+        Step from placement to a neighbor one move closer to the goal until
+        a goal is reached. Return the actions taken.
+
+        Raise UnsolvableError if the table never reached placement, which
+        would otherwise have no neighbor to step to.
+        """
+        value = self._value(placement)
+        actions = []
+
+        if value == UNREACHED:
+            raise UnsolvableError("distance table for %s never reached placement %s" % (self.tiles, placement))
+
+        while not self.is_goal(placement):
+            value = (value - 1) % 3
+            for moved in self.moves(placement):
+                if self._value(moved) == value:
+                    actions.append(divmod(moved[-1], self.shape.cols))
+                    placement = moved
+                    break
+            else:
+                raise ValueError("distance table for %s has no step down from placement %s" %
+                                 (self.tiles, placement))
+
+        return actions
+
+    def _value(self, placement):
+        return _get(self.data, rank_placement(placement, self.shape.size))
+
+
+def table_path(directory, tiles, shape=shape_4x4):
+    return os.path.join(directory, "distances-%dx%d-%s.bin" % (shape.rows, shape.cols, "-".join(map(str, tiles))))
+
+
+def _get(data, rank):
+    value = data[rank >> 2]
+    if type(value) is not int:
+        value = ord(value)
+    return (value >> ((rank & 3) << 1)) & 3
+
+
+def _set(data, rank, value):
+    shift = (rank & 3) << 1
+    data[rank >> 2] = (data[rank >> 2] & ~(3 << shift)) | (value << shift)
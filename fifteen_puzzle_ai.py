@@ -2,7 +2,15 @@
 __author__ = "Josh Kelle"
 
 import search
-from gamestate import Gamestate
+from gamestate import Gamestate, PackedGamestate, check_solvable
+from solution_cache import SolutionCache, LRUCache
+from ranking import num_placements
+from solution_optimizer import shorten_solution
+from collections import namedtuple
+import multiprocessing
+import os
+import signal
+import sys
 import time
 from pprint import pprint
 
@@ -10,7 +18,15 @@ from pprint import pprint
 #  A* solutions  #
 ##################
 
-def solve_astar_7breaks(start_state):
+# solutions to single stages, shared by all calls to solve_astar.
+# See stage_key.
+default_stage_cache = LRUCache(100000)
+
+# solve_adaptive searches stages with dense tables (see search.astar) when
+# a table has at most this many entries: up to 5 tiles on a 4 x 4 board
+max_dense_size = 6000000
+
+def solve_astar_7breaks(start_state, cache=None, **kwargs):
     targets_list = [[1, 2],
                     [1, 2, 3, 4],
                     [1, 2, 3, 4, 5, 6],
@@ -19,9 +35,9 @@ def solve_astar_7breaks(start_state):
                     [1, 2, 3, 4, 5, 6, 7, 8, 9, 13, 10, 14],
                     [1, 2, 3, 4, 5, 6, 7, 8, 9, 13, 10, 14, 11, 12, 15, 16]]
 
-    return solve_astar(start_state, targets_list)
+    return solve_astar(start_state, targets_list, cache, **kwargs)
 
-def solve_astar_6breaks(start_state):
+def solve_astar_6breaks(start_state, cache=None, **kwargs):
     targets_list = [[1, 2],
                     [1, 2, 3, 4],
                     [1, 2, 3, 4, 5, 6, 7, 8],
@@ -29,50 +45,127 @@ def solve_astar_6breaks(start_state):
                     [1, 2, 3, 4, 5, 6, 7, 8, 9, 13, 10, 14],
                     [1, 2, 3, 4, 5, 6, 7, 8, 9, 13, 10, 14, 11, 12, 15, 16]]
 
-    return solve_astar(start_state, targets_list)
+    return solve_astar(start_state, targets_list, cache, **kwargs)
 
-def solve_astar_5breaks(start_state):
+def solve_astar_5breaks(start_state, cache=None, **kwargs):
     targets_list = [[1, 2, 3, 4],
                     [1, 2, 3, 4, 5, 6, 7, 8],
                     [1, 2, 3, 4, 5, 6, 7, 8, 9, 13],
                     [1, 2, 3, 4, 5, 6, 7, 8, 9, 13, 10, 14],
                     [1, 2, 3, 4, 5, 6, 7, 8, 9, 13, 10, 14, 11, 12, 15, 16]]
 
-    return solve_astar(start_state, targets_list)
+    return solve_astar(start_state, targets_list, cache, **kwargs)
 
-def solve_astar_4breaks(start_state):
+def solve_astar_4breaks(start_state, cache=None, **kwargs):
     targets_list = [[1, 2, 3, 4],
                     [1, 2, 3, 4, 5, 6, 7, 8],
                     [1, 2, 3, 4, 5, 6, 7, 8, 9, 13, 10, 14],
                     [1, 2, 3, 4, 5, 6, 7, 8, 9, 13, 10, 14, 11, 12, 15, 16]]
 
-    return solve_astar(start_state, targets_list)
+    return solve_astar(start_state, targets_list, cache, **kwargs)
 
-def solve_astar_2breaks(start_state):
+def solve_astar_2breaks(start_state, cache=None, **kwargs):
     targets_list = [[1, 2, 3, 4, 5, 6, 7, 8],
                     [1, 2, 3, 4, 5, 6, 7, 8, 9, 13, 10, 14, 11, 12, 15, 16]]
 
-    return solve_astar(start_state, targets_list)
+    return solve_astar(start_state, targets_list, cache, **kwargs)
 
-def solve_astar_1breaks(start_state):
+def solve_astar_1breaks(start_state, cache=None, **kwargs):
     targets_list = [[1, 2, 3, 4, 5, 6, 7, 8, 9, 13, 10, 14, 11, 12, 15, 16]]
 
-    return solve_astar(start_state, targets_list)
+    return solve_astar(start_state, targets_list, cache, **kwargs)
+
+def solve_staged(start_state, cache=None):
+    """
+    solve_astar with the stages from staged_targets_list, for boards of
+    any size. On a 4 x 4 board this is solve_astar_7breaks.
+    """
+    shape = start_state.shape
+    return solve_astar(start_state, staged_targets_list(shape.rows, shape.cols), cache)
+
+def staged_targets_list(rows, cols):
+    """
+    Return a targets_list for a rows x cols board.
+
+    Rows are put in place from the top, two tiles at a time, until two rows
+    are left. Then the columns of those two rows are put in place from the
+    left, until a 2 x 2 square is left, and the last stage solves the
+    whole board.
+    """
+    targets = []
+    targets_list = []
+
+    for row in range(rows - 2):
+        for col in range(cols):
+            targets.append(row * cols + col + 1)
+            if col % 2 == 1 or col == cols - 1:
+                targets_list.append(list(targets))
 
-def solve_astar(start_state, targets_list):
+    for col in range(cols - 2):
+        targets += [(rows - 2) * cols + col + 1, (rows - 1) * cols + col + 1]
+        targets_list.append(list(targets))
+
+    targets_list.append(range(1, rows * cols + 1))
+    return targets_list
+
+def solve_astar(start_state, targets_list, cache=None, stage_cache=default_stage_cache, max_nodes=None,
+                tables=None, stats=None):
+    """
+    Solve the board in stages. Each stage runs A* until the tiles in the
+    next entry of targets_list are in place.
+
+    parameters:
+    start_state -- a Gamestate
+    targets_list -- a list of lists of tiles
+    cache -- an optional SolutionCache. Boards already in it are answered
+             from it, and new solutions are added to it.
+    stage_cache -- an LRUCache of single stage solutions keyed by stage_key,
+                   or None to solve every stage from scratch.
+    max_nodes -- optional node budget for each stage's A*. A stage that
+                 needs more falls back to IDA* (see search.astar).
+    tables -- optional dict mapping tuple(targets) to a DistanceTable
+              covering those targets. Those stages are looked up in the
+              table instead of searched.
+    stats -- optional search.SearchStats, filled in by every stage's A*.
+             The time each stage takes goes in stats.stages.
+    """
     start_time = time.time()
 
-    assert type(start_state)        is Gamestate
+    assert isinstance(start_state, (Gamestate, PackedGamestate))
     assert type(targets_list)       is list
     assert type(targets_list[0])    is list
     assert type(targets_list[0][0]) is int
 
+    check_solvable(start_state)
+
+    if cache is not None:
+        cached_actions = cache.get(start_state, targets_list)
+        if cached_actions is not None:
+            return cached_actions
+
     all_actions = []
     cur_state = start_state
 
     for targets in targets_list:
-        actions, cur_state = search.astar(cur_state, search.heuristic_3, targets, q=True)
+        stage_start_time = time.time()
+        key = stage_key(cur_state, targets)
+        actions = stage_cache.get(key) if stage_cache is not None else None
+
+        if actions is None:
+            if tables is not None and tuple(targets) in tables:
+                actions, cur_state = tables[tuple(targets)].solve(cur_state)
+            else:
+                actions, cur_state = search.astar(cur_state, search.heuristic_3, targets, q=True,
+                                                  max_nodes=max_nodes, stats=stats)
+            if stage_cache is not None:
+                stage_cache.put(key, tuple(actions))
+        else:
+            for action in actions:
+                cur_state = cur_state.get_successor(action)
+
         all_actions += actions
+        if stats is not None:
+            stats.stages.append((tuple(targets), time.time() - stage_start_time))
         cur_state.print_board()
 
     cur_state.print_board()
@@ -81,8 +174,155 @@ def solve_astar(start_state, targets_list):
     print len(all_actions), "moves"
     print "solved in %s seconds" % (time.time() - start_time)
 
+    if cache is not None:
+        cache.put(start_state, targets_list, all_actions)
+
+    return all_actions
+
+def stage_key(gamestate, targets):
+    """
+    Return a key for the stage that gets targets in place from gamestate.
+
+    A stage's search only looks at where the target tiles and the blank
+    are. The other tiles just get carried along: two move sequences lead to
+    the same board from gamestate exactly when they lead to the same board
+    from any other start. So boards which agree on the positions of the
+    targets and the blank have the same stage solution, whatever the other
+    tiles are.
+    """
+    locations = {}
+    for row, nums in enumerate(gamestate.grid):
+        for col, num in enumerate(nums):
+            locations[num] = (row, col)
+
+    return tuple(targets), tuple(locations[num] for num in targets), gamestate.blank_loc
+
+def solve_adaptive(start_state, cache=None, stage_cache=default_stage_cache, max_nodes=20000, max_h=10,
+                   stats=None):
+    """
+    Staged solve, like solve_astar, which picks its stages as it goes.
+
+    The tiles are put in place in the groups of staged_targets_list (on a
+    4 x 4 board, the stages of solve_astar_7breaks). Each stage takes on as
+    many of the next groups as it can while the heuristic for their tiles
+    stays within max_h, since a search that places more tiles at once
+    finds a shorter path for them. If the search needs more than max_nodes
+    nodes, the last group is dropped and the stage is searched again. A
+    stage down to one group always finishes: it's searched without a cap
+    if it's dense (see below), or falls back to IDA* when it runs out.
+
+    Stages with few tiles are searched with dense=True, which treats boards
+    that only differ in the other tiles as the same state. That keeps a
+    stage for 2 tiles down to a few thousand states, where plain astar
+    can expand hundreds of thousands of boards.
+
+    parameters:
+    start_state -- a Gamestate
+    cache, stage_cache, stats -- see solve_astar
+    max_nodes -- node budget for each attempt at a stage
+    max_h -- only merge groups while heuristic_3 of their tiles is at most
+             this
+    """
+    start_time = time.time()
+
+    check_solvable(start_state)
+
+    shape = start_state.shape
+    targets_list = staged_targets_list(shape.rows, shape.cols)
+    groups = [[num for num in targets if num not in prev_targets]
+              for prev_targets, targets in zip([[]] + targets_list, targets_list)]
+    cache_key = "adaptive:%s:%s" % (max_nodes, max_h)
+
+    if cache is not None:
+        cached_actions = cache.get(start_state, cache_key)
+        if cached_actions is not None:
+            return cached_actions
+
+    all_actions = []
+    cur_state = start_state
+    num_done = 0
+
+    while num_done < len(groups):
+        num_merged = 1
+        while (num_done + num_merged < len(groups) and
+               search.heuristic_3(cur_state, sum(groups[:num_done + num_merged + 1], [])) <= max_h):
+            num_merged += 1
+
+        stage_start_time = time.time()
+        while True:
+            targets = sum(groups[:num_done + num_merged], [])
+            key = stage_key(cur_state, targets)
+            actions = stage_cache.get(key) if stage_cache is not None else None
+
+            if actions is not None:
+                for action in actions:
+                    cur_state = cur_state.get_successor(action)
+                break
+
+            try:
+                dense = num_placements(len(set(targets) | set([shape.blank])), shape.size) <= max_dense_size
+                # a dense search is already bounded by the size of its table
+                last_try = num_merged == 1
+                actions, cur_state = search.astar(cur_state, search.heuristic_3, targets, q=True,
+                                                  max_nodes=None if last_try and dense else max_nodes,
+                                                  degrade=last_try, stats=stats, dense=dense)
+            except search.SearchBudgetExceeded:
+                num_merged -= 1
+                continue
+
+            if stage_cache is not None:
+                stage_cache.put(key, tuple(actions))
+            break
+
+        if stats is not None:
+            stats.stages.append((tuple(targets), time.time() - stage_start_time))
+
+        all_actions += actions
+        num_done += num_merged
+
+    assert cur_state.is_goal_state()
+
+    print len(all_actions), "moves"
+    print "solved in %s seconds" % (time.time() - start_time)
+
+    if cache is not None:
+        cache.put(start_state, cache_key, all_actions)
+
     return all_actions
 
+def solve_shortened(start_state, cache=None, max_nodes=20000, max_h=10, **kwargs):
+    """
+    solve_adaptive, then solution_optimizer.shorten_solution to take out
+    the detours where its stages meet. max_nodes, max_h and kwargs are
+    passed to solve_adaptive.
+    """
+    def solver(start_state):
+        return shorten_solution(start_state, solve_adaptive(start_state, max_nodes=max_nodes, max_h=max_h,
+                                                            **kwargs))
+
+    if cache is None:
+        return solver(start_state)
+    return cache.solve(start_state, "shortened:%s:%s" % (max_nodes, max_h), solver)
+
+def solve_anytime(start_state, time_limit=0.2, max_nodes=None):
+    """
+    Return the shortest solution found in about time_limit seconds.
+
+    Starts from the staged solve_staged solution (which is returned even
+    if it alone takes longer than time_limit), then improves on it with
+    search.anytime_astar for whatever time is left.
+    """
+    deadline = time.time() + time_limit
+    best_actions = solve_staged(start_state)
+
+    for actions, end_state in search.anytime_astar(start_state, search.heuristic_linear_conflict,
+                                                   time_limit=max(0, deadline - time.time()),
+                                                   max_cost=len(best_actions) - 1,
+                                                   max_nodes=max_nodes):
+        best_actions = actions
+
+    return best_actions
+
 ####################################
 #  depth limited search solutions  #
 ####################################
@@ -90,6 +330,8 @@ def solve_astar(start_state, targets_list):
 def solve_dls(start_state):
     start_time = time.time()
 
+    check_solvable(start_state)
+
     actions = search.iterative_deepening_dfs(start_state)
 
     print len(actions), "moves"
@@ -97,6 +339,123 @@ def solve_dls(start_state):
 
     return actions
 
+###################
+#  batch solving  #
+###################
+
+STRATEGIES = {
+    'solve_astar_7breaks': solve_astar_7breaks,
+    'solve_astar_6breaks': solve_astar_6breaks,
+    'solve_astar_5breaks': solve_astar_5breaks,
+    'solve_astar_4breaks': solve_astar_4breaks,
+    'solve_astar_2breaks': solve_astar_2breaks,
+    'solve_astar_1breaks': solve_astar_1breaks,
+    'staged':              solve_staged,
+    'adaptive':            solve_adaptive,
+    'shortened':           solve_shortened,
+    'anytime':             solve_anytime,
+    'optimal':             solve_dls,
+}
+
+# index -- position of the board in the input
+# grid -- the board, as a tuple of tuples
+# actions -- list of actions, or None if the board wasn't solved
+# seconds -- time spent on the board
+# error -- None, or a message saying why the board wasn't solved
+BatchResult = namedtuple('BatchResult', ['index', 'grid', 'actions', 'seconds', 'error'])
+
+
+class SolveTimeout(Exception):
+    """
+    Raised inside a worker when a board takes longer than its timeout.
+    """
+    pass
+
+
+def solve_batch(boards, strategy='solve_astar_7breaks', processes=None, chunksize=1, timeout=None,
+                cache_path=None):
+    """
+    Solve many boards in parallel, one process per core.
+
+    parameters:
+    boards -- an iterable of Gamestates or grids
+    strategy -- a key of STRATEGIES
+    processes -- number of worker processes. Defaults to the number of cores.
+    chunksize -- number of boards sent to a worker at a time. Larger chunks
+                 cost less overhead, but results come back a chunk at a time.
+    timeout -- seconds allowed per board, or None for no limit. A board that
+               runs out of time is reported with an error and its worker
+               moves on to the next board.
+    cache_path -- optional sqlite file of a SolutionCache shared by the
+                  workers. Boards already in it aren't solved again.
+
+    return:
+    Yield a BatchResult per board, in the order they finish.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError("unknown strategy %r, expected one of %s" % (strategy, sorted(STRATEGIES)))
+
+    tasks = ((index, _to_grid(board), strategy, timeout) for index, board in enumerate(boards))
+    pool = multiprocessing.Pool(processes, _init_worker, (cache_path,))
+
+    try:
+        for result in pool.imap_unordered(_solve_task, tasks, chunksize):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _to_grid(board):
+    if hasattr(board, 'grid'):
+        return tuple(map(tuple, board.grid))
+    return tuple(map(tuple, board))
+
+
+_worker_cache = None
+
+def _init_worker(cache_path):
+    global _worker_cache
+
+    # the solvers print boards as they go, which is just noise in a batch
+    sys.stdout = open(os.devnull, 'w')
+
+    if cache_path is not None:
+        _worker_cache = SolutionCache(cache_path)
+
+
+def _raise_timeout(signum, frame):
+    raise SolveTimeout()
+
+
+def _solve_task((index, grid, strategy, timeout)):
+    """
+    Solve a single board in a worker process. Return a BatchResult.
+    """
+    start_time = time.time()
+    actions = None
+    error = None
+
+    if timeout is not None:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    try:
+        if _worker_cache is None:
+            actions = STRATEGIES[strategy](Gamestate(grid))
+        else:
+            actions = _worker_cache.solve(Gamestate(grid), strategy, STRATEGIES[strategy])
+    except SolveTimeout:
+        error = "timed out after %s seconds" % timeout
+    except Exception as e:
+        error = "%s: %s" % (type(e).__name__, e)
+    finally:
+        if timeout is not None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    return BatchResult(index, grid, actions, time.time() - start_time, error)
+
 #######################
 #  compare solutions  #
 #######################
@@ -1,34 +1,98 @@
 
 __author__ = "Josh Kelle"
 
-correct_locations = {
-                      1: (0, 0),   2: (0, 1),   3: (0, 2),   4: (0, 3),
-                      5: (1, 0),   6: (1, 1),   7: (1, 2),   8: (1, 3),
-                      9: (2, 0),  10: (2, 1),  11: (2, 2),  12: (2, 3),
-                     13: (3, 0),  14: (3, 1),  15: (3, 2),  16: (3, 3)
-                    }
+
+class BoardShape(object):
+
+    """
+    Everything about a board size which is the same for every board of that
+    size. Each size is set up once, by board_shape, and shared.
+
+    rows, cols -- the board's dimensions
+    size -- rows * cols
+    blank -- the number which represents the blank tile (size)
+    tiles -- all tile numbers, 1 - size, including the blank
+    correct_locations -- a dict mapping each tile to its (row, col)
+                         location in the goal state
+    goal_grid -- the goal state, as a tuple of tuples
+    neighbor_table -- move table: neighbor_table[row * cols + col] is a
+                      tuple of the (row, col) locations next to (row, col),
+                      in row-major order. When (row, col) is the blank
+                      tile's location, these are exactly the legal actions.
+    bits -- bits per cell in a PackedGamestate
+    """
+
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.size = rows * cols
+        self.blank = self.size
+        self.tiles = tuple(range(1, self.size + 1))
+
+        self.correct_locations = dict((row * cols + col + 1, (row, col))
+                                      for row in range(rows) for col in range(cols))
+        self.goal_grid = tuple(tuple(row * cols + col + 1 for col in range(cols)) for row in range(rows))
+
+        self.neighbor_table = tuple(tuple((r, c) for r, c in ((row-1, col), (row, col-1), (row, col+1), (row+1, col))
+                                          if 0 <= r < rows and 0 <= c < cols)
+                                    for row in range(rows) for col in range(cols))
+
+        self.bits = max(1, (self.size - 1).bit_length())
+
+    def __repr__(self):
+        return "board_shape(%d, %d)" % (self.rows, self.cols)
+
+
+_board_shapes = {}
+
+def board_shape(rows, cols):
+    """
+    Return the BoardShape for boards with the given dimensions.
+    """
+    if (rows, cols) not in _board_shapes:
+        _board_shapes[rows, cols] = BoardShape(rows, cols)
+    return _board_shapes[rows, cols]
+
+
+# the standard 4 x 4 board
+shape_4x4 = board_shape(4, 4)
+correct_locations = shape_4x4.correct_locations
+goal_grid = shape_4x4.goal_grid
+neighbor_table = shape_4x4.neighbor_table
+
+
+class UnsolvableError(Exception):
+    """
+    Raised when asked to solve a board which can't reach the goal state.
+    """
+    pass
+
 
 class Gamestate(object):
 
     """
     This class represents a single state of the game board.
-    Uses a 2D (4 x 4) list of integers 1 - 16.
-    16 represents the blank tile.
+    Uses a 2D (rows x cols) list of integers 1 - rows * cols, usually 4 x 4.
+    The largest number (16 on a 4 x 4 board) represents the blank tile.
     """
 
-    def __init__(self, grid):
+    def __init__(self, grid, shape=None, blank_loc=None):
         """
         Contructor
 
         parameters:
-        grid -- a 2D (4 x 4) list of ints
+        grid -- a 2D (rows x cols) list of ints
+        shape -- the grid's BoardShape. Looked up from grid if not given.
+        blank_loc -- (row, col) of the blank tile, if already known.
+                     Found by scanning grid if not given.
         """
         # convert to tuples to 1) ensure the state doesn't change
         #                  and 2) make the hash function quick
         self.grid = tuple(map(tuple, grid))
+        self.shape = shape or board_shape(len(self.grid), len(self.grid[0]))
 
         # remember position of blank tile to make legal move checking quick
-        self.blank_loc = self._find_16()
+        self.blank_loc = self._find_blank() if blank_loc is None else blank_loc
 
     def get_successor(self, action):
         """
@@ -37,59 +101,78 @@ class Gamestate(object):
 
         parameters:
         action -- a 2-tuple specifying which tile to "click."
-                  Must be adjacent to the blank tile (#16).
+                  Must be adjacent to the blank tile.
 
         return:
         Return a new Gamestate object.
         """
-        assert self._is_legal_action(action)
+        shape = self.shape
+        blank_row, blank_col = self.blank_loc
+        assert action in shape.neighbor_table[blank_row * shape.cols + blank_col]
 
         row, col = action
-        blank_row, blank_col = self.blank_loc
-        
+
         new_grid = [list(row_) for row_ in self.grid]
         new_grid[blank_row][blank_col] = new_grid[row][col]
-        new_grid[row][col] = 16
+        new_grid[row][col] = shape.blank
 
-        return Gamestate(new_grid)
-        #return Gamestate(new_grid, (row, col))
+        # the clicked tile's location is the new blank location
+        return Gamestate(new_grid, shape, action)
 
-    def get_legal_actions(self):
+    def get_legal_actions(self, exclude=None):
         """
         Return a list of all posible actions actions. An action is a tile
         location which a player touches to move. So the action must be next
         to the blank tile.
 
+        parameters:
+        exclude -- an action to leave out. Searches pass the parent's blank
+                   location here so they don't generate the move that
+                   undoes the parent's move.
+
         return:
         Return a list of 2-tuples of integers.
         """
-        # slow
-        actions = [(r, c) for r in range(4) for c in range(4) if self._is_legal_action((r,c))]
-        assert len(actions) in (2, 3, 4)
-        return actions
+        blank_row, blank_col = self.blank_loc
+        return [action for action in self.shape.neighbor_table[blank_row * self.shape.cols + blank_col]
+                if action != exclude]
 
-    def is_goal_state(self, targets=range(1,17)):
+    def is_goal_state(self, targets=None):
         """
         Return True if all targets are in their correct locations.
 
         parameters:
-        targets -- a list of (row, col) int tuples.
+        targets -- a list of tile numbers.
                    This allows the client to define what a goal state is.
                    By changing targets, the client can detect, for example,
                    when only the first 4 tiles are in the right place.
-                   Defaults to all 16 tiles.
+                   Defaults to all tiles.
         """
-        for row in range(4):
-            for col in range(4):
-                num = self.grid[row][col]
-                if num in targets and correct_locations[num] != (row, col):
+        correct_locations = self.shape.correct_locations
+
+        for row, nums in enumerate(self.grid):
+            for col, num in enumerate(nums):
+                if (targets is None or num in targets) and correct_locations[num] != (row, col):
                     return False
 
         return True
 
+    def get_tile(self, (row, col)):
+        """
+        Return the number of the tile at (row, col).
+        """
+        return self.grid[row][col]
+
+    def is_solvable(self):
+        """
+        Return True if the goal state can be reached from this Gamestate.
+        See is_solvable_grid.
+        """
+        return is_solvable_grid(self.grid)
+
     def print_board(self):
         """
-        Display the board as a 4 x 4 grid of integers.
+        Display the board as a grid of integers.
         """
         print "\n".join(["".join(["%3d" % num for num in row]) for row in self.grid]) + "\n"
 
@@ -104,33 +187,285 @@ class Gamestate(object):
         return:
         Return True or False
         """
-        if not 0 <= row <= 3 or not 0 <= col <= 3:
-            return False
-
         blank_row, blank_col = self.blank_loc
-        return (row == blank_row and abs(col - blank_col) == 1) or \
-               (col == blank_col and abs(row - blank_row) == 1)
+        return (row, col) in self.shape.neighbor_table[blank_row * self.shape.cols + blank_col]
 
-    def _find_16(self):
+    def _find_blank(self):
         """
         Return the (row, col) position of the blank tile.
-        This method should only be called once - in the constuctor.
+        This method should only be called once - in the constuctor,
+        and only when the caller didn't pass blank_loc.
         """
-        for row in range(4):
-            for col in range(4):
-                if self.grid[row][col] == 16:
+        for row, nums in enumerate(self.grid):
+            for col, num in enumerate(nums):
+                if num == self.shape.blank:
                     return row, col
 
-        raise Exception("16 not found")
+        raise Exception("%d not found" % self.shape.blank)
 
     def __hash__(self):
         return hash(self.grid)
 
     def __eq__(self, other):
-        return other.grid == self.grid
+        # a PackedGamestate hashes differently, so it's never equal
+        return isinstance(other, Gamestate) and other.grid == self.grid
+
+
+class MutableGamestate(Gamestate):
+
+    """
+    A Gamestate whose grid is changed in place by make_move, so a depth
+    first search can make and unmake moves without allocating a new
+    Gamestate per node. Not hashable.
+    """
+
+    __hash__ = None
+
+    def __init__(self, grid):
+        """
+        Contructor
+
+        parameters:
+        grid -- a 2D (rows x cols) list of ints
+        """
+        self.grid = [list(row) for row in grid]
+        self.shape = board_shape(len(self.grid), len(self.grid[0]))
+        self.blank_loc = self._find_blank()
+
+    def make_move(self, action):
+        """
+        Take a given action on this board, in place.
+
+        parameters:
+        action -- a 2-tuple specifying which tile to "click."
+                  Must be adjacent to the blank tile.
+
+        return:
+        Return the action that undoes this move (the old blank location).
+        """
+        assert self._is_legal_action(action)
+
+        row, col = action
+        blank_row, blank_col = self.blank_loc
+
+        self.grid[blank_row][blank_col] = self.grid[row][col]
+        self.grid[row][col] = self.shape.blank
+        self.blank_loc = action
+
+        return blank_row, blank_col
+
+
+class PackedGamestate(object):
+
+    """
+    A compact drop-in replacement for Gamestate.
+    The board is packed into a single int, shape.bits bits per cell (4 on a
+    4 x 4 board), where the cell at (row, col) occupies the field starting
+    at bit shape.bits * (row * cols + col) and holds its tile number minus 1.
+    The index of the blank cell is cached.
+    """
+
+    __slots__ = ('board', 'blank_index', 'shape')
+
+    def __init__(self, grid):
+        """
+        Contructor
+
+        parameters:
+        grid -- a 2D (rows x cols) list of ints, same as for Gamestate
+        """
+        self.shape = board_shape(len(grid), len(grid[0]))
+        self.board = pack_grid(grid)
+        self.blank_index = self._find_blank()
+
+    @classmethod
+    def from_board(cls, board, blank_index, shape=shape_4x4):
+        """
+        Build a PackedGamestate directly from a packed board, skipping the
+        conversion from grid form.
+        """
+        state = object.__new__(cls)
+        state.board = board
+        state.blank_index = blank_index
+        state.shape = shape
+        return state
+
+    @classmethod
+    def from_gamestate(cls, gamestate):
+        return cls(gamestate.grid)
+
+    def to_gamestate(self):
+        return Gamestate(self.grid, self.shape)
+
+    @property
+    def grid(self):
+        """
+        The board as a tuple of tuples, same as Gamestate.grid.
+        """
+        return unpack_board(self.board, self.shape)
+
+    @property
+    def blank_loc(self):
+        return divmod(self.blank_index, self.shape.cols)
+
+    def get_successor(self, action):
+        """
+        Generate a new PackedGamestate that would result from taking a given
+        action on this PackedGamestate. See Gamestate.get_successor.
+        """
+        shape = self.shape
+        assert action in shape.neighbor_table[self.blank_index]
+
+        row, col = action
+        index = row * shape.cols + col
+        shift = index * shape.bits
+        blank_shift = self.blank_index * shape.bits
+
+        # swap the two fields: xor each with the xor of both values
+        mask = (1 << shape.bits) - 1
+        swap = ((self.board >> shift) & mask) ^ (shape.blank - 1)
+        board = self.board ^ (swap << shift) ^ (swap << blank_shift)
+
+        return PackedGamestate.from_board(board, index, shape)
+
+    def get_legal_actions(self, exclude=None):
+        """
+        Return a list of all posible actions. See Gamestate.get_legal_actions.
+        """
+        return [action for action in self.shape.neighbor_table[self.blank_index] if action != exclude]
+
+    def is_goal_state(self, targets=None):
+        """
+        Return True if all targets are in their correct locations.
+        See Gamestate.is_goal_state.
+        """
+        shape = self.shape
+        if targets is None:
+            targets = shape.tiles
+
+        board = self.board
+        mask = (1 << shape.bits) - 1
+        for num in targets:
+            row, col = shape.correct_locations[num]
+            if (board >> ((row * shape.cols + col) * shape.bits)) & mask != num - 1:
+                return False
+
+        return True
+
+    def get_tile(self, (row, col)):
+        """
+        Return the number of the tile at (row, col).
+        """
+        shape = self.shape
+        return ((self.board >> ((row * shape.cols + col) * shape.bits)) & ((1 << shape.bits) - 1)) + 1
+
+    def is_solvable(self):
+        """
+        Return True if the goal state can be reached from this state.
+        """
+        return is_solvable_grid(self.grid)
+
+    def print_board(self):
+        """
+        Display the board as a grid of integers.
+        """
+        print "\n".join(["".join(["%3d" % num for num in row]) for row in self.grid]) + "\n"
+
+    def _is_legal_action(self, (row, col)):
+        """
+        Make sure a given location is 1) a valid location on the board,
+        and 2) next to the blank tile.
+        """
+        return (row, col) in self.shape.neighbor_table[self.blank_index]
+
+    def _find_blank(self):
+        """
+        Return the board index of the blank tile.
+        This method should only be called once - in the constuctor.
+        """
+        shape = self.shape
+        mask = (1 << shape.bits) - 1
+        for index in range(shape.size):
+            if (self.board >> (index * shape.bits)) & mask == shape.blank - 1:
+                return index
+
+        raise Exception("%d not found" % shape.blank)
+
+    def __hash__(self):
+        return hash(self.board)
+
+    def __eq__(self, other):
+        # only equal to other PackedGamestates, since a Gamestate with the
+        # same grid hashes differently
+        return type(other) is PackedGamestate and other.board == self.board and other.shape is self.shape
+
+    def __ne__(self, other):
+        return not self == other
+
+
+def is_solvable_grid(grid):
+    """
+    Return True if the goal state can be reached from the board in grid.
+
+    Every move swaps the blank with a tile, which flips the parity of the
+    board's permutation and moves the blank one step. So the board can be
+    solved iff the permutation's parity matches the parity of the blank's
+    manhattan distance from its correct location. The parity is found by
+    counting cycles, so this is linear in the number of cells.
+    """
+    shape = board_shape(len(grid), len(grid[0]))
+    nums = [num for row in grid for num in row]
+    seen = [False] * shape.size
+    cycles = 0
+
+    for index in range(shape.size):
+        if not seen[index]:
+            cycles += 1
+            while not seen[index]:
+                seen[index] = True
+                # tile n belongs at index n - 1
+                index = nums[index] - 1
+
+    blank_row, blank_col = divmod(nums.index(shape.blank), shape.cols)
+    goal_row, goal_col = shape.correct_locations[shape.blank]
+    blank_dist = abs(blank_row - goal_row) + abs(blank_col - goal_col)
+
+    return (shape.size - cycles) % 2 == blank_dist % 2
+
+
+def check_solvable(gamestate):
+    """
+    Raise UnsolvableError if gamestate can't be solved.
+    Every solver runs this first.
+    """
+    if not gamestate.is_solvable():
+        raise UnsolvableError("board can't be solved:\n%s" %
+                              "\n".join(" ".join("%2d" % num for num in row) for row in gamestate.grid))
+
+
+def pack_grid(grid):
+    """
+    Pack a 2D list of ints into a single int, shape.bits bits per cell
+    (4 bits per cell on a 4 x 4 board).
+    """
+    bits = board_shape(len(grid), len(grid[0])).bits
+    board = 0
+    for index, num in enumerate(num for row in grid for num in row):
+        board |= (num - 1) << (index * bits)
+    return board
+
+
+def unpack_board(board, shape=shape_4x4):
+    """
+    Inverse of pack_grid. Return the board as a tuple of tuples.
+    """
+    mask = (1 << shape.bits) - 1
+    nums = [((board >> (index * shape.bits)) & mask) + 1 for index in range(shape.size)]
+    return tuple(tuple(nums[row*shape.cols:(row+1)*shape.cols]) for row in range(shape.rows))
+
 
 if __name__ == '__main__':
-    board = Gamestate([[ 1,  2,  3,  4], 
-                       [ 5, 16,  6,  8], 
-                       [ 9, 14,  7, 11], 
+    board = Gamestate([[ 1,  2,  3,  4],
+                       [ 5, 16,  6,  8],
+                       [ 9, 14,  7, 11],
                        [13, 15, 10, 12]])
@@ -0,0 +1,220 @@
+
+__author__ = "Josh Kelle"
+
+"""
+Disjoint additive pattern databases.
+
+The tiles are split into disjoint groups. For each group, a table holds the
+number of moves of that group's tiles needed to get them to their correct
+locations, for every placement of the group's tiles and the blank. Other
+tiles are treated as indistinguishable and moving them costs nothing.
+Since every move moves exactly one tile, the values from the different
+groups can be added together and the sum is still an admissible heuristic.
+
+The blank is part of the placement because the group's tiles can wall it
+off from part of the board, and then where it is changes the cost. A table
+that only kept the cheapest blank position would let one move change the
+value by more than 1, and astar, which never reopens a state, needs a
+consistent heuristic.
+
+Tables are built by a breadth first search backwards from the goal, stored
+on disk as one byte per placement, and memory-mapped when loaded, so
+several solver processes share one physical copy.
+
+Groups of up to 6 tiles are practical: each 6-tile group of the 6-6-3
+partition has 16!/9! (about 5.8e7) placements with the blank, a 55 MB
+table which takes on the order of ten minutes to build. A 7-8 partition is
+stronger, but its 8-tile group has about 4e9, far more than build_table
+can search in pure Python.
+"""
+
+from gamestate import shape_4x4
+from ranking import num_placements, rank_placement, unrank_placement
+from collections import deque
+import bisect
+import mmap
+import os
+import time
+
+# the usual partition of the 15 tiles
+PARTITION_663 = ((1, 5, 6, 9, 10, 13), (7, 8, 11, 12, 14, 15), (2, 3, 4))
+
+
+def goal_indices(shape):
+    """
+    Return a dict mapping each tile to the board index of its correct location.
+    """
+    return dict((num, row * shape.cols + col) for num, (row, col) in shape.correct_locations.items())
+
+
+def neighbor_indices(shape):
+    """
+    Return a tuple whose i'th entry holds the board indices next to board index i.
+    """
+    return tuple(tuple(row * shape.cols + col for row, col in locations)
+                 for locations in shape.neighbor_table)
+
+
+class PatternDatabase(object):
+
+    """
+    An additive pattern database heuristic.
+    Call it like any other heuristic: pdb(gamestate, targets).
+    """
+
+    def __init__(self, tables, shape=shape_4x4):
+        """
+        Contructor. Use build or load instead of calling this directly.
+
+        parameters:
+        tables -- a list of (tiles, table) pairs. tiles is a tuple of tile
+                  numbers and table is a bytearray or mmap indexed by
+                  rank_placement of the tiles' locations followed by the
+                  blank's.
+        shape -- the BoardShape the tables were built for
+        """
+        self.tables = tables
+        self.shape = shape
+
+    @classmethod
+    def build(cls, partition=PARTITION_663, directory=None, q=False, shape=shape_4x4):
+        """
+        Build a table for each group in partition.
+        If directory is given, also save the tables there (see load).
+        This is slow for groups of more than 5 or so tiles.
+        """
+        tables = []
+
+        for tiles in partition:
+            start_time = time.time()
+            table = build_table(tiles, shape)
+
+            if not q:
+                print "built table for %s in %s seconds" % (tiles, time.time() - start_time)
+
+            if directory is not None:
+                with open(table_path(directory, tiles, shape), 'wb') as f:
+                    f.write(table)
+
+            tables.append((tuple(tiles), table))
+
+        return cls(tables, shape)
+
+    @classmethod
+    def load(cls, directory, partition=PARTITION_663, shape=shape_4x4):
+        """
+        Memory-map tables previously saved by build.
+
+        Raise ValueError for a table of the wrong size, like one saved
+        before tables included the blank.
+        """
+        tables = []
+
+        for tiles in partition:
+            path = table_path(directory, tiles, shape)
+            with open(path, 'rb') as f:
+                table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+            if len(table) != num_placements(len(tiles) + 1, shape.size):
+                raise ValueError("%s has %d entries, expected %d; rebuild it" %
+                                 (path, len(table), num_placements(len(tiles) + 1, shape.size)))
+
+            tables.append((tuple(tiles), table))
+
+        return cls(tables, shape)
+
+    def __call__(self, gamestate, targets=None):
+        """
+        Heuristic value of gamestate.
+
+        Only groups whose tiles are all in targets count, so the value
+        stays admissible for staged goals too. targets defaults to every
+        tile.
+        """
+        shape = self.shape
+        if targets is None:
+            targets = shape.tiles
+
+        locations = [0] * (shape.size + 1)
+        for row, nums in enumerate(gamestate.grid):
+            for col, num in enumerate(nums):
+                locations[num] = row * shape.cols + col
+
+        cost = 0
+        for tiles, table in self.tables:
+            if all(num in targets for num in tiles):
+                value = table[rank_placement([locations[num] for num in tiles + (shape.blank,)], shape.size)]
+                cost += value if type(value) is int else ord(value)
+
+        return cost
+
+
+def table_path(directory, tiles, shape=shape_4x4):
+    name = "-".join(map(str, tiles))
+    if shape is not shape_4x4:
+        name = "%dx%d-%s" % (shape.rows, shape.cols, name)
+    return os.path.join(directory, "pdb-%s.bin" % name)
+
+
+def build_table(tiles, shape=shape_4x4):
+    """
+    Build the table for a single group of tiles on boards of the given shape.
+
+    Does a 0-1 breadth first search from the goal over placements of tiles
+    followed by the blank, where a move costs 1 if it moves one of tiles
+    and 0 otherwise. Every placement with tiles in their correct locations
+    is a goal, wherever the blank is.
+
+    return:
+    Return a bytearray indexed by rank_placement of the tiles' locations
+    followed by the blank's.
+    """
+    num_tiles = len(tiles)
+    num_cells = shape.size
+    # the blank is the last digit of the rank: its index among the cells
+    # the tiles leave free
+    num_free = num_cells - num_tiles
+    table = bytearray('\xff' * num_placements(num_tiles + 1, num_cells))
+
+    goals = goal_indices(shape)
+    neighbors = neighbor_indices(shape)
+    goal = [goals[num] for num in tiles]
+    fringe = deque(rank_placement(goal + [index], num_cells) << 8
+                   for index in range(num_cells) if index not in goal)
+    prev_tiles_rank = None
+
+    while fringe:
+        item = fringe.popleft()
+        rank, cost = item >> 8, item & 0xFF
+
+        if table[rank] != 0xFF:
+            continue
+        table[rank] = cost
+
+        # moves of the blank alone are searched first, so runs of states
+        # share the tiles' placement
+        tiles_rank, blank_digit = divmod(rank, num_free)
+        if tiles_rank != prev_tiles_rank:
+            placement = unrank_placement(tiles_rank, num_tiles, num_cells)
+            free = [index for index in range(num_cells) if index not in placement]
+            prev_tiles_rank = tiles_rank
+        blank_index = free[blank_digit]
+
+        for index in neighbors[blank_index]:
+            if index in placement:
+                moved = list(placement)
+                moved[placement.index(index)] = blank_index
+                # index's place among the free cells, now that the tile
+                # has moved from index to blank_index
+                digit = bisect.bisect(free, index) - (blank_index < index)
+                fringe.append(((rank_placement(moved, num_cells) * num_free + digit) << 8) | (cost + 1))
+            else:
+                fringe.appendleft(((tiles_rank * num_free + free.index(index)) << 8) | cost)
+
+    return table
+
+
+if __name__ == '__main__':
+    import sys
+    directory = sys.argv[1] if len(sys.argv) > 1 else "."
+    PatternDatabase.build(PARTITION_663, directory)
@@ -9,6 +9,7 @@ Pieter Abbeel (pabbeel@cs.berkeley.edu).
 """
 
 import heapq
+from collections import deque
 
 class PriorityQueue:
     """
@@ -35,3 +36,59 @@ class PriorityQueue:
     def isEmpty(self):
         return len(self.heap) == 0
 
+    def peekPriority(self):
+        """
+        Return the lowest priority in the queue, without popping it.
+        """
+        return self.heap[0][0]
+
+    def __len__(self):
+        return len(self.heap)
+
+
+class BucketPriorityQueue:
+    """
+    A priority queue for small non-negative integer priorities, like the
+    f values of a search. Items are kept in one bucket per priority and the
+    lowest bucket that might be non-empty is tracked, so push and pop are
+    O(1) amortized as long as priorities don't grow without bound.
+
+    Items with the same priority come out last in, first out by default,
+    which in a search favors the most recently generated (deeper) nodes.
+    Pass lifo=False for first in, first out.
+    """
+    def  __init__(self, lifo=True):
+        self.buckets = []
+        self.min_priority = 0
+        self.size = 0
+        self.lifo = lifo
+
+    def push(self, item, priority):
+        while len(self.buckets) <= priority:
+            self.buckets.append(deque())
+
+        self.buckets[priority].append(item)
+        self.size += 1
+
+        if priority < self.min_priority:
+            self.min_priority = priority
+
+    def pop(self):
+        if self.size == 0:
+            raise IndexError("pop from empty priority queue")
+
+        while not self.buckets[self.min_priority]:
+            self.min_priority += 1
+
+        self.size -= 1
+        bucket = self.buckets[self.min_priority]
+        if self.lifo:
+            return bucket.pop()
+        return bucket.popleft()
+
+    def isEmpty(self):
+        return self.size == 0
+
+    def __len__(self):
+        return self.size
+
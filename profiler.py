@@ -0,0 +1,89 @@
+
+__author__ = "Josh Kelle"
+
+"""
+A sampling profiler, for finding where a search spends its time without
+editing it.
+
+Every interval seconds of CPU time a SIGPROF signal interrupts the program
+and the call stack is recorded. Sampling costs far less than cProfile's
+tracing of every call, which slows the search loop down a lot and skews
+the numbers towards functions that are called often. Only works on unix,
+in the main thread.
+
+    profiler = SamplingProfiler()
+    with profiler:
+        search.astar(gamestate, q=True)
+    for name, own, total in profiler.top(10):
+        print name, own, total
+"""
+
+from collections import Counter
+import os
+import signal
+
+
+class SamplingProfiler(object):
+
+    """
+    own_samples counts the samples where a function was running itself,
+    total_samples the samples where it was anywhere on the stack. Functions
+    are named "file:function".
+    """
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.own_samples = Counter()
+        self.total_samples = Counter()
+        self.num_samples = 0
+        self._old_handler = None
+
+    def start(self):
+        self._old_handler = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self._old_handler or signal.SIG_DFL)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _sample(self, signum, frame):
+        self.num_samples += 1
+        self.own_samples[_frame_name(frame)] += 1
+
+        seen = set()
+        while frame is not None:
+            name = _frame_name(frame)
+            if name not in seen:
+                seen.add(name)
+                self.total_samples[name] += 1
+            frame = frame.f_back
+
+    def top(self, n=20):
+        """
+        Return the n functions with the most own samples, as
+        (name, own_samples, total_samples) tuples.
+        """
+        return [(name, own, self.total_samples[name]) for name, own in self.own_samples.most_common(n)]
+
+    def as_dict(self, n=20):
+        """
+        Return the top n functions as a dict of plain values, e.g. for
+        json.dump.
+        """
+        return {
+            'interval': self.interval,
+            'samples': self.num_samples,
+            'top': [{'function': name, 'own': own, 'total': total} for name, own, total in self.top(n)],
+        }
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return "%s:%s" % (os.path.basename(code.co_filename), code.co_name)
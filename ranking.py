@@ -0,0 +1,182 @@
+
+__author__ = "Josh Kelle"
+
+"""
+Perfect hashes of boards: map boards, or the positions of just some of
+their tiles, to dense integers. Tables indexed by rank can then be flat
+bytearrays instead of sets and dicts of Gamestates.
+
+A placement is a list of distinct board indices (row * cols + col), one
+per tile of interest. Placements of k tiles on n cells are ranked in
+lexicographic order (a Lehmer code), into [0, n! / (n-k)!). Whole boards
+are permutations, ranked with Myrvold and Ruskey's linear time ranking
+into [0, n!).
+"""
+
+from gamestate import shape_4x4
+
+
+def num_placements(num_tiles, num_cells=16):
+    """
+    Number of ways to put num_tiles distinct tiles on num_cells cells.
+    """
+    count = 1
+    for i in range(num_tiles):
+        count *= num_cells - i
+    return count
+
+
+def rank_placement(placement, num_cells=16):
+    """
+    Map a list of distinct board indices to an integer in
+    [0, num_placements(len(placement), num_cells)).
+    """
+    rank = 0
+    used = 0
+    for i, index in enumerate(placement):
+        # count the cells not used by earlier tiles which come before index
+        digit = index - bin(used & ((1 << index) - 1)).count('1')
+        rank = rank * (num_cells - i) + digit
+        used |= 1 << index
+    return rank
+
+
+def unrank_placement(rank, num_tiles, num_cells=16):
+    """
+    Inverse of rank_placement.
+    """
+    digits = []
+    for i in reversed(range(num_tiles)):
+        rank, digit = divmod(rank, num_cells - i)
+        digits.append(digit)
+    digits.reverse()
+
+    free = range(num_cells)
+    return [free.pop(digit) for digit in digits]
+
+
+def rank_permutation(perm):
+    """
+    Myrvold and Ruskey's rank of a permutation of 0 - n-1, an integer in
+    [0, n!). Linear time, but not in lexicographic order.
+    """
+    perm = list(perm)
+    inverse = [0] * len(perm)
+    for i, value in enumerate(perm):
+        inverse[value] = i
+
+    rank = 0
+    radix = 1
+    for n in range(len(perm), 1, -1):
+        value = perm[n - 1]
+        perm[n - 1], perm[inverse[n - 1]] = perm[inverse[n - 1]], perm[n - 1]
+        inverse[value], inverse[n - 1] = inverse[n - 1], inverse[value]
+        rank += value * radix
+        radix *= n
+    return rank
+
+
+def unrank_permutation(rank, n):
+    """
+    Inverse of rank_permutation.
+    """
+    perm = range(n)
+    for size in range(n, 0, -1):
+        rank, value = divmod(rank, size)
+        perm[size - 1], perm[value] = perm[value], perm[size - 1]
+    return perm
+
+
+def rank_board(gamestate):
+    """
+    Rank of a whole board, in [0, rows * cols !). See rank_permutation.
+    """
+    return rank_permutation([num - 1 for row in gamestate.grid for num in row])
+
+
+def unrank_board(rank, shape=shape_4x4):
+    """
+    Inverse of rank_board. Return the board as a tuple of tuples.
+    """
+    nums = [value + 1 for value in unrank_permutation(rank, shape.size)]
+    return tuple(tuple(nums[row*shape.cols:(row+1)*shape.cols]) for row in range(shape.rows))
+
+
+class StateIndex(object):
+
+    """
+    Ranks boards by where the target tiles and the blank are. Boards which
+    only differ in their other tiles get the same rank. That's exactly when
+    they're the same state of a staged search for targets (see
+    fifteen_puzzle_ai.stage_key), so a search for targets can use ranks in
+    place of states.
+    """
+
+    def __init__(self, targets, shape=shape_4x4):
+        self.shape = shape
+        self.tiles = sorted(num for num in targets if num != shape.blank) + [shape.blank]
+        self.size = num_placements(len(self.tiles), shape.size)
+
+    def __call__(self, gamestate):
+        locations = {}
+        for row, nums in enumerate(gamestate.grid):
+            for col, num in enumerate(nums):
+                locations[num] = row * self.shape.cols + col
+
+        return rank_placement([locations[num] for num in self.tiles], self.shape.size)
+
+    def bitset(self):
+        return BitSet(self.size)
+
+    def byte_table(self):
+        return ByteTable(self.size)
+
+
+class BitSet(object):
+
+    """
+    A set of ints in [0, size), one bit each. Used like a set.
+    """
+
+    def __init__(self, size):
+        self.bits = bytearray((size + 7) // 8)
+        self.count = 0
+
+    def add(self, key):
+        mask = 1 << (key & 7)
+        if not self.bits[key >> 3] & mask:
+            self.bits[key >> 3] |= mask
+            self.count += 1
+
+    def __contains__(self, key):
+        return bool(self.bits[key >> 3] & (1 << (key & 7)))
+
+    def __len__(self):
+        return self.count
+
+
+class ByteTable(object):
+
+    """
+    A map from ints in [0, size) to ints in [0, 255), one byte each.
+    Used like a dict.
+    """
+
+    def __init__(self, size):
+        self.values = bytearray('\xff' * size)
+        self.count = 0
+
+    def get(self, key, default=None):
+        value = self.values[key]
+        return default if value == 0xFF else value
+
+    def __setitem__(self, key, value):
+        if self.values[key] == 0xFF:
+            self.count += 1
+        self.values[key] = value
+
+    def __contains__(self, key):
+        return self.values[key] != 0xFF
+
+    def __len__(self):
+        return self.count
@@ -4,12 +4,17 @@ __author__ = "Josh Kelle"
 """
 Several graph search functions:
     - A* (several heuristics to choose from)
+    - bidirectional A*
     - depth limited search
-    - iterative deepening search
+    - iterative deepening search (IDA*)
 """
 
-from gamestate import Gamestate, correct_locations
-from priority_queue import PriorityQueue
+from gamestate import Gamestate, MutableGamestate, check_solvable
+from priority_queue import PriorityQueue, BucketPriorityQueue
+from ranking import StateIndex
+from collections import deque
+import itertools
+import sys
 import time
 
 
@@ -24,148 +29,978 @@ def dist((a,b), (x,y)):
     return abs(a-x) + abs(b-y)
 
 
-def heuristic_0(gamestate):
+def heuristic_0(gamestate, targets=None):
     """
     null heuristic
     """
     return 0
 
 
-def heuristic_1(gamestate):
+def heuristic_1(gamestate, targets=None):
     """
     Add 1 for each tile which is out of place.
+    The blank tile isn't counted, which keeps the heuristic admissible.
+    targets is ignored; it's accepted so that every heuristic can be
+    called as heuristic(gamestate, targets).
     """
-    global correct_locations
-    grid = gamestate.grid
+    shape = gamestate.shape
+    correct_locations = shape.correct_locations
     cost = 0
 
-    for row in range(4):
-        for col in range(4):
-            if (row, col) != correct_locations[grid[row][col]]:
+    for row, nums in enumerate(gamestate.grid):
+        for col, num in enumerate(nums):
+            if num != shape.blank and (row, col) != correct_locations[num]:
                 cost += 1
 
     return cost
 
 
-def heuristic_2(gamestate):
+def heuristic_2(gamestate, targets=None):
     """
     For each tile, add manhattan distance from tile's current location
-    to it's goal location.
+    to it's goal location. The blank tile isn't counted.
+    targets is ignored.
     """
-    global correct_locations
-    grid = gamestate.grid
+    shape = gamestate.shape
+    correct_locations = shape.correct_locations
     cost = 0
 
-    for row in range(4):
-        for col in range(4):
-            cost += dist((row, col), correct_locations[grid[row][col]])
+    for row, nums in enumerate(gamestate.grid):
+        for col, num in enumerate(nums):
+            if num != shape.blank:
+                cost += dist((row, col), correct_locations[num])
 
     return cost
 
 
-def heuristic_3(gamestate, targets):
+def heuristic_3(gamestate, targets, parent=None):
     """
     Same as heuristic_2, but only consider certain tiles.
 
     parameters:
     targets -- list of integers. These are the tiles which count towards
                the heuristic value.
+    parent -- optional (parent_h, parent_blank_loc) tuple, where parent_h is
+              this heuristic's value for the state gamestate was generated
+              from and parent_blank_loc is that state's blank location.
+              If given, the value is updated from parent_h in O(1) instead
+              of rescanning the board.
     """
-    global correct_locations
-    grid = gamestate.grid
+    shape = gamestate.shape
+    correct_locations = shape.correct_locations
+
+    if parent is not None:
+        parent_h, parent_blank_loc = parent
+        # the moved tile went from gamestate.blank_loc to parent_blank_loc
+        num = gamestate.get_tile(parent_blank_loc)
+        if num not in targets or num == shape.blank:
+            return parent_h
+
+        goal = correct_locations[num]
+        return parent_h - dist(gamestate.blank_loc, goal) + dist(parent_blank_loc, goal)
+
     cost = 0
 
-    for row in range(4):
-        for col in range(4):
-            num = grid[row][col]
-            if num in targets:
+    for row, nums in enumerate(gamestate.grid):
+        for col, num in enumerate(nums):
+            if num in targets and num != shape.blank:
                 cost += dist((row, col), correct_locations[num])
 
     return cost
 
+heuristic_3.incremental = True
+
+
+def heuristic_linear_conflict(gamestate, targets, parent=None):
+    """
+    heuristic_3 plus linear conflicts.
+
+    Two target tiles are in conflict when they are both in the row (or
+    column) they belong in, but in the wrong order. One of them has to
+    leave the line and come back, which costs 2 moves that manhattan
+    distance doesn't count. For each line, add 2 for each tile that would
+    have to be removed to leave the rest in order.
+
+    parameters:
+    targets -- see heuristic_3
+    parent -- see heuristic_3. Only the two lines the moved tile left and
+              entered are recounted, so this is O(line length).
+    """
+    shape = gamestate.shape
+
+    if parent is None:
+        grid = gamestate.grid
+        cost = heuristic_3(gamestate, targets)
+
+        for row in range(shape.rows):
+            cost += 2 * _line_conflicts(grid[row], row, 0, targets, shape)
+        for col in range(shape.cols):
+            cost += 2 * _line_conflicts([nums[col] for nums in grid], col, 1, targets, shape)
+
+        return cost
+
+    parent_h, parent_blank_loc = parent
+    num = gamestate.get_tile(parent_blank_loc)
+    if num not in targets or num == shape.blank:
+        return parent_h
+
+    grid = gamestate.grid
+    (row, col), (parent_row, parent_col) = gamestate.blank_loc, parent_blank_loc
+    goal = shape.correct_locations[num]
+    cost = parent_h - dist((row, col), goal) + dist(parent_blank_loc, goal)
+
+    # a horizontal move doesn't change the order of the tiles in its row,
+    # but takes the tile out of one column and into another. Same for
+    # vertical moves, rows and columns swapped.
+    if row == parent_row:
+        lines = [([r[col] for r in grid], col, 1), ([r[parent_col] for r in grid], parent_col, 1)]
+    else:
+        lines = [(grid[row], row, 0), (grid[parent_row], parent_row, 0)]
+
+    blank = shape.blank
+    for nums, line, axis in lines:
+        # the parent's line is the same, with the tile and blank swapped back
+        parent_nums = [num if n == blank else blank if n == num else n for n in nums]
+        cost += 2 * (_line_conflicts(nums, line, axis, targets, shape) -
+                     _line_conflicts(parent_nums, line, axis, targets, shape))
+
+    return cost
+
+heuristic_linear_conflict.incremental = True
+
+
+def _line_conflicts(nums, line, axis, targets, shape):
+    """
+    Return how many target tiles in nums would have to be removed from the
+    line so that the rest are in order.
+
+    parameters:
+    nums -- the tiles along a row (axis 0) or a column (axis 1)
+    line -- the number of that row or column
+    shape -- the board's BoardShape
+    """
+    correct_locations = shape.correct_locations
+    goals = [correct_locations[num][1 - axis] for num in nums
+             if num in targets and num != shape.blank and correct_locations[num][axis] == line]
+
+    # longest increasing subsequence. lines are short
+    longest = [1] * len(goals)
+    for i in range(len(goals)):
+        for j in range(i):
+            if goals[j] < goals[i] and longest[j] + 1 > longest[i]:
+                longest[i] = longest[j] + 1
+
+    return len(goals) - max(longest + [0])
+
+
+class WalkingDistance(int):
+
+    """
+    The value returned by heuristic_walking_distance. It's an int, but it
+    also remembers the vertical and horizontal walking distance states,
+    so a child's value can be found from it incrementally.
+    """
+
+    def __new__(cls, value, vertical_key, horizontal_key, tables):
+        self = int.__new__(cls, value)
+        self.vertical_key = vertical_key
+        self.horizontal_key = horizontal_key
+        self.tables = tables
+        return self
+
+
+def heuristic_walking_distance(gamestate, targets, parent=None):
+    """
+    Walking distance.
+
+    Looking only at rows, a board can be described by how many tiles in each
+    row belong in each row, plus which row the blank is in. Moving a tile
+    up or down changes that description, moving it sideways doesn't. The
+    fewest vertical moves to get from a board's description to the goal's
+    is precomputed (see _walking_distance_table). Do the same for columns
+    and add the two. This is never less than heuristic_3, and often more.
+
+    parameters:
+    targets -- see heuristic_3. Tiles not in targets may be moved for free.
+    parent -- see heuristic_3. The parent_h must be a WalkingDistance
+              returned by this function. Updated in O(1).
+    """
+    shape = gamestate.shape
+    rows, cols = shape.rows, shape.cols
+
+    if parent is not None:
+        parent_h, parent_blank_loc = parent
+        num = gamestate.get_tile(parent_blank_loc)
+        (row, col), (parent_row, parent_col) = gamestate.blank_loc, parent_blank_loc
+        vertical_key, horizontal_key = parent_h.vertical_key, parent_h.horizontal_key
+        is_target = num in targets and num != shape.blank
+
+        # the tile moved from (row, col) to (parent_row, parent_col),
+        # the blank the other way
+        if row != parent_row:
+            if is_target:
+                goal_row = shape.correct_locations[num][0]
+                vertical_key += ((1 << 3 * (rows * parent_row + goal_row)) -
+                                 (1 << 3 * (rows * row + goal_row)))
+            vertical_key += (row - parent_row) << 3 * rows * rows
+        else:
+            if is_target:
+                goal_col = shape.correct_locations[num][1]
+                horizontal_key += ((1 << 3 * (cols * parent_col + goal_col)) -
+                                   (1 << 3 * (cols * col + goal_col)))
+            horizontal_key += (col - parent_col) << 3 * cols * cols
+
+        vertical_table, horizontal_table = parent_h.tables
+        return WalkingDistance(vertical_table[vertical_key] + horizontal_table[horizontal_key],
+                               vertical_key, horizontal_key, parent_h.tables)
+
+    row_counts = [0] * rows
+    col_counts = [0] * cols
+    vertical_key = 0
+    horizontal_key = 0
+
+    for row, nums in enumerate(gamestate.grid):
+        for col, num in enumerate(nums):
+            if num in targets and num != shape.blank:
+                goal_row, goal_col = shape.correct_locations[num]
+                row_counts[goal_row] += 1
+                col_counts[goal_col] += 1
+                vertical_key += 1 << 3 * (rows * row + goal_row)
+                horizontal_key += 1 << 3 * (cols * col + goal_col)
+
+    blank_row, blank_col = gamestate.blank_loc
+    vertical_key += blank_row << 3 * rows * rows
+    horizontal_key += blank_col << 3 * cols * cols
+
+    tables = (_walking_distance_table(tuple(row_counts), cols),
+              _walking_distance_table(tuple(col_counts), rows))
+    return WalkingDistance(tables[0][vertical_key] + tables[1][horizontal_key],
+                           vertical_key, horizontal_key, tables)
+
+heuristic_walking_distance.incremental = True
+
+
+def evaluate(heuristic, gamestate, targets, parent=None):
+    """
+    Call heuristic(gamestate, targets), passing parent along when the
+    heuristic supports incremental updates (see heuristic_3).
+    Search engines use this so any heuristic can be plugged in.
+    """
+    if parent is not None and getattr(heuristic, 'incremental', False):
+        return heuristic(gamestate, targets, parent)
+    return heuristic(gamestate, targets)
+
+
+_walking_distance_tables = {}
+
+def _walking_distance_table(counts, line_length):
+    """
+    Return a dict mapping every reachable walking distance state to its
+    distance from a goal state. Tables are built once and cached.
+
+    A state is encoded as an int: with n lines, the number of target tiles
+    in line r which belong in line g is kept in 3 bits at bit 3 * (n * r + g),
+    and the blank's line is kept at bit 3 * n * n. Lines are rows or columns,
+    the table is the same either way.
+
+    parameters:
+    counts -- counts[g] is the number of target tiles that belong in line g.
+              The rest of each line is filled by free (non-target) tiles.
+    line_length -- number of cells in each line (at most 7)
+
+    The table is built by a 0-1 breadth first search from all goal states,
+    where moving a target tile costs 1 and moving a free tile costs 0.
+    """
+    if (counts, line_length) in _walking_distance_tables:
+        return _walking_distance_tables[counts, line_length]
+
+    num_lines = len(counts)
+    blank_shift = 3 * num_lines * num_lines
+
+    goal_key = sum(count << 3 * (num_lines * line + line) for line, count in enumerate(counts))
+    fringe = deque((goal_key + (blank << blank_shift), 0)
+                   for blank in range(num_lines) if counts[blank] < line_length)
+    table = {}
+
+    while fringe:
+        key, cost = fringe.popleft()
+        if key in table:
+            continue
+        table[key] = cost
+
+        blank = key >> blank_shift
+        for line in (blank - 1, blank + 1):
+            if not 0 <= line < num_lines:
+                continue
+
+            # move the blank into line, and a tile from line into the blank's line
+            moved_blank = key + ((line - blank) << blank_shift)
+            line_counts = [(key >> 3 * (num_lines * line + goal)) & 7 for goal in range(num_lines)]
+
+            for goal, count in enumerate(line_counts):
+                if count:
+                    fringe.append((moved_blank + (1 << 3 * (num_lines * blank + goal)) -
+                                   (1 << 3 * (num_lines * line + goal)), cost + 1))
+            if sum(line_counts) < line_length:
+                fringe.appendleft((moved_blank, cost))
+
+    _walking_distance_tables[counts, line_length] = table
+    return table
+
 
 ######
 # A* #
 ######
 
-def astar(start_gamestate, heuristic=heuristic_3, targets=range(1,17), q=False):
+class NoSolution(Exception):
+    """
+    Raised when a search runs out of states without reaching a goal,
+    for example because every path is longer than max_cost.
+    """
+    pass
+
+
+class SearchTimeout(Exception):
+    """
+    Raised by astar or ida_star when it's still searching at its deadline.
+    """
+    pass
+
+
+class SearchBudgetExceeded(Exception):
+    """
+    Raised by astar when it runs out of its node budget and isn't allowed
+    to degrade.
+    """
+    pass
+
+
+class SearchStats(object):
+
+    """
+    Numbers about a single search. Pass one to a search and it fills it in.
+
+    degraded -- True if astar ran out of its node budget and fell back to
+                ida_star
+    peak_nodes -- the most nodes astar held in memory at once
+    expanded -- number of nodes expanded
+    generated -- number of successors generated
+    deduplicated -- successors dropped because their state was already
+                    reached as cheaply, plus stale fringe entries skipped
+                    when popped
+    fringe_peak -- the most entries on astar's fringe at once
+    heuristic_calls -- number of heuristic evaluations
+    heuristic_seconds -- time spent in them
+    seconds -- time spent searching
+    stages -- (targets, seconds) for each stage of
+              fifteen_puzzle_ai.solve_astar
+
+    Counts add up when the same SearchStats is passed to several searches,
+    like the stages of fifteen_puzzle_ai.solve_astar.
+
+    If callback is given, searches call callback(stats) every interval
+    expansions, to report progress or export the numbers while a search
+    is still running.
+    """
+
+    def __init__(self, callback=None, interval=10000):
+        self.degraded = False
+        self.peak_nodes = 0
+        self.expanded = 0
+        self.generated = 0
+        self.deduplicated = 0
+        self.fringe_peak = 0
+        self.heuristic_calls = 0
+        self.heuristic_seconds = 0.0
+        self.seconds = 0.0
+        self.stages = []
+        self.callback = callback
+        self.interval = interval
+        self._depth = 0
+        self._start_time = None
+
+    def start(self):
+        """
+        Called when a search starts. Searches run inside other searches
+        (astar falling back to ida_star) aren't timed twice.
+        """
+        if self._depth == 0:
+            self._start_time = time.time()
+        self._depth += 1
+
+    def stop(self):
+        """
+        Called when a search finishes, however it finishes.
+        """
+        self._depth -= 1
+        if self._depth == 0:
+            self.seconds += time.time() - self._start_time
+            self._start_time = None
+
+    def elapsed(self):
+        """
+        Seconds spent searching so far, including a search still running.
+        """
+        if self._start_time is None:
+            return self.seconds
+        return self.seconds + time.time() - self._start_time
+
+    def expansions_per_second(self):
+        elapsed = self.elapsed()
+        return self.expanded / elapsed if elapsed else 0.0
+
+    def as_dict(self):
+        """
+        Return the numbers as a dict of plain values, e.g. for json.dump.
+        """
+        return {
+            'degraded': self.degraded,
+            'peak_nodes': self.peak_nodes,
+            'expanded': self.expanded,
+            'generated': self.generated,
+            'deduplicated': self.deduplicated,
+            'fringe_peak': self.fringe_peak,
+            'heuristic_calls': self.heuristic_calls,
+            'heuristic_seconds': self.heuristic_seconds,
+            'seconds': self.elapsed(),
+            'expansions_per_second': self.expansions_per_second(),
+            'stages': [{'targets': list(targets), 'seconds': seconds} for targets, seconds in self.stages],
+        }
+
+
+def astar(start_gamestate, heuristic=heuristic_3, targets=None, q=False, bucket_queue=False,
+          max_nodes=None, max_bytes=None, degrade=True, stats=None,
+          weight=1, max_cost=None, deadline=None, dense=False):
     """
     parameters:
     start_gamestate -- a Gamestate object
-    heuristic -- a function
+    heuristic -- a function, called as heuristic(gamestate, targets).
+                 Must be consistent (no move changes it by more than 1)
+                 for the path to be optimal, since closed states are
+                 never reopened (see below). All the heuristics here are,
+                 including PatternDatabase and DistanceTable. A heuristic
+                 which is only admissible needs ida_star instead.
     targets -- a list of (row, col) positions which need to be in the correct
-               spot on the board. Determines goal state.
+               spot on the board. Determines goal state. Defaults to every
+               tile.
     q -- quiet flag. If False, print out info to give some indication of
          progress
+    bucket_queue -- if True, use a BucketPriorityQueue for the fringe
+                    instead of a binary heap. The heuristic must return ints.
+    max_nodes -- optional limit on the number of nodes held in memory
+                 (states seen plus fringe entries).
+    max_bytes -- optional memory budget, turned into a node limit using an
+                 estimate of the bytes per node (see bytes_per_node).
+    degrade -- what to do when the budget would be exceeded. If True, drop
+               everything and finish with ida_star, which needs almost no
+               memory and keeps to max_cost and deadline. If False, raise
+               SearchBudgetExceeded.
+    stats -- optional SearchStats to fill in (see SearchStats for its
+             callback hook)
+    weight -- multiplies h, so f = g + weight * h. Weights above 1 find a
+              solution faster, but it's only guaranteed to be within weight
+              times the optimal length. With bucket_queue, weight must be an
+              int.
+    max_cost -- optional bound. Nodes with g + h above it are never pushed,
+                so only solutions no longer than max_cost are found.
+    deadline -- optional time.time() value. Raise SearchTimeout if the
+                search is still going then.
+    dense -- if True, states are tracked by rank (see ranking.StateIndex)
+             in a bitset and a byte per placement of the targets and the
+             blank, instead of in a set and a dict of states. Only for
+             stages with few targets: 6 targets on a 4 x 4 board take
+             57 MB, all 16 can't be done. The heuristic must only look at
+             the targets and the blank, which all the heuristics here do.
+
+    Nodes are ordered by f = g + h of the node itself. Ties on f go to the
+    node with the higher g (it's likely closer to a goal), then to the
+    node pushed first, so the fringe never compares nodes. With
+    bucket_queue, ties go to the node pushed last instead, which usually
+    also has the higher g.
+
+    A state is closed once it's expanded. Until then, a node is only pushed
+    if it's cheaper than the best path to its state seen so far, and older
+    more expensive copies are skipped when they're popped. With a
+    consistent heuristic a state is first expanded by its cheapest path;
+    with an inconsistent one a cheaper path can turn up later, and is
+    dropped.
+
+    Raise UnsolvableError if start_gamestate can't be solved.
+    """
+    check_solvable(start_gamestate)
+
+    if stats is None:
+        stats = SearchStats()
+
+    targets = frozenset(targets or start_gamestate.shape.tiles)
+
+    if max_bytes is not None:
+        budget = max_bytes // bytes_per_node(start_gamestate, heuristic(start_gamestate, targets))
+        max_nodes = budget if max_nodes is None else min(max_nodes, budget)
+
+    stats.start()
+    try:
+        return _astar(start_gamestate, heuristic, targets, q, bucket_queue, max_nodes, degrade, stats,
+                      weight, max_cost, deadline, dense)
+    finally:
+        stats.stop()
+
+
+def _astar(start_gamestate, heuristic, targets, q, bucket_queue, max_nodes, degrade, stats,
+           weight, max_cost, deadline, dense):
+    """
+    The search loop of astar. astar checks the arguments and times it.
     """
     start_time = time.time()
-    cur_state = start_gamestate
-    cur_actions = []
     prev_len = -1
+    clock = time.time
+    callback = stats.callback
+
+    counter = itertools.count()
+    heuristic_start = clock()
+    start_node = SearchNode(start_gamestate, h=heuristic(start_gamestate, targets))
+    stats.heuristic_seconds += clock() - heuristic_start
+    stats.heuristic_calls += 1
+    if bucket_queue:
+        fringe = BucketPriorityQueue()
+        fringe.push(start_node, weight * start_node.h)
+    else:
+        fringe = PriorityQueue()
+        fringe.push(start_node, (weight * start_node.h, 0, next(counter)))
+
+    if dense:
+        state_index = StateIndex(targets, start_gamestate.shape)
+        best_g = state_index.byte_table()
+        closed = state_index.bitset()
+    else:
+        state_index = None
+        best_g = {}
+        closed = set()
+
+    best_g[start_gamestate if state_index is None else state_index(start_gamestate)] = 0
+
+    while not fringe.isEmpty():
+        cur_node = fringe.pop()
+        cur_state = cur_node.state
+        cur_key = cur_state if state_index is None else state_index(cur_state)
+
+        # a cheaper copy of this state was already expanded
+        if cur_key in closed:
+            stats.deduplicated += 1
+            continue
+
+        if cur_state.is_goal_state(targets):
+            stats.peak_nodes = max(stats.peak_nodes, len(best_g) + len(fringe))
+            return cur_node.get_actions(), cur_state
 
-    fringe = PriorityQueue()
-    visited_states = set([cur_state])
+        closed.add(cur_key)
+        stats.expanded += 1
+        # the fringe was largest just before this pop
+        if len(fringe) >= stats.fringe_peak:
+            stats.fringe_peak = len(fringe) + 1
+        if callback is not None and stats.expanded % stats.interval == 0:
+            callback(stats)
+
+        if deadline is not None and time.time() > deadline:
+            raise SearchTimeout()
 
-    while not cur_state.is_goal_state(targets):
-        
         # print info to the screen
         # pretty poor way to track program's progress
-        if not q and len(cur_actions) > prev_len:
-            print len(cur_actions), time.time() - start_time
-            prev_len = len(cur_actions)
+        if not q and cur_node.g > prev_len:
+            print cur_node.g, time.time() - start_time
+            prev_len = cur_node.g
 
-        # push neighboring states onto fringe
-        for action in cur_state.get_legal_actions():
+        # push neighboring states onto fringe,
+        # skipping the move that undoes the previous move
+        g = cur_node.g + 1
+        for action in cur_state.get_legal_actions(cur_node.get_prev_blank_loc()):
             successor = cur_state.get_successor(action)
-            
-            if successor not in visited_states:
-                # add neighbor to fringe
-                # g = len(cur_actions) + 1
-                # h = heuristic
-                priority = len(cur_actions) + 1 + heuristic(cur_state, targets)
-                # remember state as visited
-                visited_states.add(successor)
-                fringe.push( (successor, cur_actions + [action]), priority )
+            key = successor if state_index is None else state_index(successor)
+            stats.generated += 1
+
+            if key in closed or g >= best_g.get(key, float('inf')):
+                stats.deduplicated += 1
+                continue
+
+            # pushing adds a fringe entry and (usually) a best_g entry
+            num_nodes = len(best_g) + len(fringe)
+            if max_nodes is not None and num_nodes + 2 > max_nodes:
+                stats.peak_nodes = max(stats.peak_nodes, num_nodes)
+                del fringe, best_g, closed, cur_node, start_node
+                if not degrade:
+                    raise SearchBudgetExceeded("astar needs more than %d nodes" % max_nodes)
+
+                if not q:
+                    print "astar ran out of nodes (%d), falling back to ida_star" % max_nodes
+                stats.degraded = True
+                # ida_star's solution is optimal, so it's within any weight's bound
+                return ida_star(start_gamestate, heuristic, targets, q=True, stats=stats,
+                                max_cost=max_cost, deadline=deadline)
 
-        # get next state from fringe, skipping ones we've seen already
-        cur_state, cur_actions = fringe.pop()
+            heuristic_start = clock()
+            h = evaluate(heuristic, successor, targets, (cur_node.h, cur_state.blank_loc))
+            stats.heuristic_seconds += clock() - heuristic_start
+            stats.heuristic_calls += 1
+            if max_cost is not None and g + h > max_cost:
+                continue
 
-    return cur_actions, cur_state
+            best_g[key] = g
+            if bucket_queue:
+                fringe.push(SearchNode(successor, cur_node, action, g, h), g + weight * h)
+            else:
+                fringe.push(SearchNode(successor, cur_node, action, g, h), (g + weight * h, -g, next(counter)))
+
+    raise NoSolution()
+
+
+def anytime_astar(start_gamestate, heuristic=heuristic_3, targets=None, time_limit=None,
+                  weights=(5, 3, 2, 1.5, 1.2, 1), max_cost=None, max_nodes=None):
+    """
+    Anytime search: yield solutions that keep getting shorter, until time
+    runs out or the last one is known to be optimal.
+
+    Runs weighted A* (see astar) once per weight, largest first. A large
+    weight finds some solution quickly, and smaller weights find better
+    ones. Each run only looks for solutions shorter than the best one so
+    far. Once the weight 1 run finishes, whether it finds one or not, the
+    last solution yielded is optimal (given an admissible heuristic).
+
+    A weighted run that finds nothing proves nothing: it closes each state
+    at the first g it reaches, which may not be the cheapest, so it can
+    miss a shorter solution. The search goes on to the next weight.
+
+    parameters:
+    start_gamestate, heuristic, targets -- see astar
+    time_limit -- seconds to keep improving for, or None for no limit
+    weights -- weights to try, in order. Should end with 1.
+    max_cost -- only yield solutions no longer than this
+    max_nodes -- node budget for each run (see astar). A run that needs
+                 more ends the search.
+
+    Yield (actions, end_state) tuples, same as astar returns.
+    """
+    deadline = None if time_limit is None else time.time() + time_limit
+
+    for weight in weights:
+        try:
+            actions, end_state = astar(start_gamestate, heuristic, targets, q=True, max_nodes=max_nodes,
+                                       degrade=False, weight=weight, max_cost=max_cost, deadline=deadline)
+        except NoSolution:
+            if weight == 1:
+                return
+            continue
+        except (SearchTimeout, SearchBudgetExceeded):
+            return
+
+        yield actions, end_state
+        max_cost = len(actions) - 1
+
+
+def bytes_per_node(gamestate, h=0):
+    """
+    Estimate the memory astar uses per node: the SearchNode, its state,
+    its h value, a best_g entry and a fringe entry. Used to turn a byte
+    budget into a node budget.
+
+    parameters:
+    gamestate -- the start state
+    h -- the heuristic's value for gamestate. Some heuristics return more
+         than a plain int (see WalkingDistance).
+    """
+    size = sys.getsizeof(SearchNode(gamestate)) + sys.getsizeof(gamestate) + sys.getsizeof(h)
+
+    if hasattr(h, '__dict__'):
+        # tables like WalkingDistance.tables are shared by every node,
+        # only the numbers are per node
+        size += sys.getsizeof(h.__dict__)
+        size += sum(sys.getsizeof(value) for value in h.__dict__.values() if isinstance(value, (int, long)))
+
+    if hasattr(gamestate, '__dict__'):
+        size += sys.getsizeof(gamestate.__dict__) + sys.getsizeof(gamestate.blank_loc)
+        size += sys.getsizeof(gamestate.grid) + sum(sys.getsizeof(row) for row in gamestate.grid)
+    else:
+        size += sum(sys.getsizeof(getattr(gamestate, name)) for name in gamestate.__slots__)
+
+    # dict and set slots, the fringe's (priority, node) pair and priority tuple
+    return size + 200
+
+
+class SearchNode(object):
+
+    """
+    A node in the A* search tree.
+
+    Nodes only hold a reference to the node they were generated from and
+    the action which generated them, instead of a copy of the whole list of
+    actions. The list is rebuilt once, by get_actions, when the goal is found.
+    """
+
+    __slots__ = ('state', 'parent', 'action', 'g', 'h')
+
+    def __init__(self, state, parent=None, action=None, g=0, h=0):
+        self.state = state
+        self.parent = parent
+        self.action = action
+        self.g = g
+        self.h = h
+
+    def get_prev_blank_loc(self):
+        """
+        Return the blank location in the parent's state, or None for the root.
+        """
+        if self.parent is None:
+            return None
+        return self.parent.state.blank_loc
+
+    def get_actions(self):
+        """
+        Return the list of actions that lead from the root to this node.
+        """
+        actions = []
+        node = self
+        while node.parent is not None:
+            actions.append(node.action)
+            node = node.parent
+
+        actions.reverse()
+        return actions
+
+
+####################
+# bidirectional A* #
+####################
+
+def bidirectional_astar(start_gamestate, heuristic=heuristic_3, q=False, stats=None):
+    """
+    Solve the whole board with two A* searches, one forward from
+    start_gamestate guided by heuristic, and one backward from the goal
+    guided by manhattan distance to start_gamestate (see manhattan_to).
+    Each step expands a node from whichever search has the smaller fringe.
+
+    Whenever a search reaches a state the other has reached, the two paths
+    join into a solution. The search stops once the best solution found is
+    no longer than the smallest f on either fringe. With consistent
+    heuristics nothing left can beat it, so the solution is optimal.
+
+    parameters:
+    start_gamestate -- a Gamestate object
+    heuristic -- a function, called as heuristic(gamestate, targets)
+    q -- quiet flag. If False, print the best solution length as it improves.
+    stats -- optional SearchStats to fill in. Nodes and the fringe are
+             counted over both searches.
+
+    return:
+    Return an (actions, end_state) tuple, same as astar.
+
+    Raise UnsolvableError if start_gamestate can't be solved.
+    """
+    check_solvable(start_gamestate)
+
+    if stats is None:
+        stats = SearchStats()
+
+    stats.start()
+    try:
+        return _bidirectional_astar(start_gamestate, heuristic, q, stats)
+    finally:
+        stats.stop()
+
+
+def _bidirectional_astar(start_gamestate, heuristic, q, stats):
+    """
+    The search loop of bidirectional_astar. bidirectional_astar times it.
+    """
+    targets = frozenset(start_gamestate.shape.tiles)
+    goal_gamestate = type(start_gamestate)(start_gamestate.shape.goal_grid)
+    forward = _Frontier(start_gamestate, heuristic, targets, stats)
+    backward = _Frontier(goal_gamestate, manhattan_to(start_gamestate), targets, stats)
+
+    best_cost = float('inf')
+    meeting_state = None
+
+    # meetings are only noticed on newly generated nodes, so a board that's
+    # already solved has to be caught here
+    if start_gamestate in backward.best_nodes:
+        best_cost = 0
+        meeting_state = start_gamestate
+
+    while not forward.fringe.isEmpty() and not backward.fringe.isEmpty():
+        stats.fringe_peak = max(stats.fringe_peak, len(forward.fringe) + len(backward.fringe))
+
+        if best_cost <= max(forward.min_f(), backward.min_f()):
+            break
+
+        if len(forward.fringe) <= len(backward.fringe):
+            search, other = forward, backward
+        else:
+            search, other = backward, forward
+
+        for node in search.expand():
+            if node.state in other.best_nodes:
+                cost = node.g + other.best_nodes[node.state].g
+                if cost < best_cost:
+                    best_cost = cost
+                    meeting_state = node.state
+                    if not q:
+                        print "found a %d move solution" % cost
+
+    stats.peak_nodes = max(stats.peak_nodes, len(forward.best_nodes) + len(forward.fringe) +
+                           len(backward.best_nodes) + len(backward.fringe))
+
+    if meeting_state is None:
+        raise NoSolution()
+
+    # actions back from the meeting state to the goal: to undo the move
+    # from a backward node's parent, click the parent's blank location
+    actions = forward.best_nodes[meeting_state].get_actions()
+    node = backward.best_nodes[meeting_state]
+    while node.parent is not None:
+        actions.append(node.parent.state.blank_loc)
+        node = node.parent
+
+    return actions, goal_gamestate
+
+
+class _Frontier(object):
+
+    """
+    One direction of bidirectional_astar. Same rules as astar: nodes are
+    ordered by (f, -g, counter), and states are closed when expanded.
+    """
+
+    def __init__(self, root, heuristic, targets, stats):
+        self.heuristic = heuristic
+        self.targets = targets
+        self.stats = stats
+        self.counter = itertools.count()
+        self.fringe = PriorityQueue()
+        self.closed = set()
+
+        heuristic_start = time.time()
+        root_node = SearchNode(root, h=heuristic(root, targets))
+        stats.heuristic_seconds += time.time() - heuristic_start
+        stats.heuristic_calls += 1
+        self.best_nodes = {root: root_node}
+        self.fringe.push(root_node, (root_node.h, 0, next(self.counter)))
+
+    def min_f(self):
+        return self.fringe.peekPriority()[0]
+
+    def expand(self):
+        """
+        Pop the best open node and push its successors.
+        Return a list of the new nodes.
+        """
+        stats = self.stats
+        cur_node = self.fringe.pop()
+        cur_state = cur_node.state
+
+        if cur_state in self.closed:
+            stats.deduplicated += 1
+            return []
+        self.closed.add(cur_state)
+
+        stats.expanded += 1
+        if stats.callback is not None and stats.expanded % stats.interval == 0:
+            stats.callback(stats)
+
+        new_nodes = []
+        g = cur_node.g + 1
+        for action in cur_state.get_legal_actions(cur_node.get_prev_blank_loc()):
+            successor = cur_state.get_successor(action)
+            stats.generated += 1
+
+            if successor in self.closed:
+                stats.deduplicated += 1
+                continue
+            if successor in self.best_nodes and g >= self.best_nodes[successor].g:
+                stats.deduplicated += 1
+                continue
+
+            heuristic_start = time.time()
+            h = evaluate(self.heuristic, successor, self.targets, (cur_node.h, cur_state.blank_loc))
+            stats.heuristic_seconds += time.time() - heuristic_start
+            stats.heuristic_calls += 1
+            node = SearchNode(successor, cur_node, action, g, h)
+            self.best_nodes[successor] = node
+            self.fringe.push(node, (g + h, -g, next(self.counter)))
+            new_nodes.append(node)
+
+        return new_nodes
+
+
+def manhattan_to(target_gamestate):
+    """
+    Return a heuristic like heuristic_3, except it measures manhattan
+    distance to where each tile is in target_gamestate, rather than to the
+    goal state. Supports incremental updates the same way.
+    """
+    blank = target_gamestate.shape.blank
+    locations = {}
+    for row, nums in enumerate(target_gamestate.grid):
+        for col, num in enumerate(nums):
+            locations[num] = (row, col)
+
+    def heuristic(gamestate, targets, parent=None):
+        if parent is not None:
+            parent_h, parent_blank_loc = parent
+            num = gamestate.get_tile(parent_blank_loc)
+            if num not in targets or num == blank:
+                return parent_h
+
+            location = locations[num]
+            return parent_h - dist(gamestate.blank_loc, location) + dist(parent_blank_loc, location)
+
+        cost = 0
+        for row, nums in enumerate(gamestate.grid):
+            for col, num in enumerate(nums):
+                if num in targets and num != blank:
+                    cost += dist((row, col), locations[num])
+
+        return cost
+
+    heuristic.incremental = True
+    return heuristic
 
 
 ########################
 # depth limited search #
 ########################
 
-def iterative_deepening_dfs(start_state):
+def iterative_deepening_dfs(start_state, heuristic=heuristic_3, targets=None, q=False, stats=None):
     """
     Iterative deepening depth first search.
 
+    The limit is deepened on f = g + h rather than one level at a time
+    (see ida_star). Pass heuristic_0 for plain iterative deepening.
+
     Return a list of actions. Actions are (row, col) tuples.
     """
-    depth_limit = 0
-    is_solved = False
-    
-    while not is_solved:
-        depth_limit += 1
-        print "depth_limit =", depth_limit
-        is_solved, actions_to_solution = dls_helper(start_state, [], 0, depth_limit)
-
-    assert is_solved
-    return actions_to_solution
+    actions, end_state = ida_star(start_state, heuristic, targets, q, stats)
+    return actions
 
 
-def dls(start_state, max_depth):
+def dls(start_state, max_depth, stats=None):
     """
     Depth limited search.
     
     Do dfs treating nodes at max_depth as leaves.
     Don't stop on first solution; remember all solutions and return the best one.
+    stats is an optional SearchStats to fill in.
     """
-    return dls_helper(start_state, [], 0, max_depth)
+    check_solvable(start_state)
+
+    if stats is None:
+        stats = SearchStats()
+
+    stats.start()
+    try:
+        return dls_helper(start_state, [], 0, max_depth, stats=stats)
+    finally:
+        stats.stop()
 
 
-def dls_helper(cur_state, actions_so_far, depth, depth_limit):
+def dls_helper(cur_state, actions_so_far, depth, depth_limit, prev_blank_loc=None, stats=None):
     """
     Recursive helper function for dls.
 
@@ -176,6 +1011,10 @@ def dls_helper(cur_state, actions_so_far, depth, depth_limit):
     depth -- current depth in the search tree
     depth_limit -- do not search in depths that exceed depth_limit.
                    Treat nodes at this depth as leaves.
+    prev_blank_loc -- location of the blank tile in the parent state.
+                      The move back there is skipped since it would just
+                      undo the parent's move.
+    stats -- optional SearchStats to count nodes in
 
     Return -- (is_solved, actions) tuple, where is_solved is True or False.
               If is_solved is True, actions = a list of all actions to get form
@@ -189,10 +1028,19 @@ def dls_helper(cur_state, actions_so_far, depth, depth_limit):
     if depth == depth_limit:
         return False, actions_so_far
 
-    for action in cur_state.get_legal_actions():
+    if stats is None:
+        stats = SearchStats()
+
+    stats.expanded += 1
+    if stats.callback is not None and stats.expanded % stats.interval == 0:
+        stats.callback(stats)
+
+    for action in cur_state.get_legal_actions(prev_blank_loc):
         successor = cur_state.get_successor(action)
+        stats.generated += 1
         actions_so_far.append(action)
-        is_solved, actions_to_solution = dls_helper(successor, actions_so_far, depth+1, depth_limit)
+        is_solved, actions_to_solution = dls_helper(successor, actions_so_far, depth+1, depth_limit,
+                                                    cur_state.blank_loc, stats)
 
         if is_solved:
             return is_solved, actions_to_solution
@@ -202,3 +1050,136 @@ def dls_helper(cur_state, actions_so_far, depth, depth_limit):
 
     return False, actions_so_far
 
+
+
+########
+# IDA* #
+########
+
+def ida_star(start_state, heuristic=heuristic_3, targets=None, q=False, stats=None, goal_state=None,
+             max_cost=None, deadline=None):
+    """
+    Iterative deepening A*.
+
+    Repeats a depth first search which treats nodes whose f = g + h exceeds
+    a threshold as leaves. The threshold starts at h(start_state) and is
+    raised to the smallest f that exceeded it. With an admissible heuristic
+    the first solution found is optimal. Moves are made and unmade in place
+    on a single MutableGamestate, so memory is O(depth).
+
+    parameters:
+    start_state -- a Gamestate object
+    heuristic -- a function, called as heuristic(gamestate, targets).
+                 Incremental heuristics are passed the parent's value.
+    targets -- list of tiles which need to be in the correct spot on the
+               board. Determines goal state. Defaults to every tile.
+    q -- quiet flag. If False, print out each threshold.
+    stats -- optional SearchStats. Nodes are counted over every
+             iteration. Heuristic calls are counted but not timed, which
+             would cost about as much as the calls themselves.
+    goal_state -- optional board to reach, instead of the goal. heuristic
+                  must then estimate the distance to goal_state, like
+                  manhattan_to(goal_state) does, and targets is ignored.
+    max_cost -- optional bound. Raise NoSolution rather than look for
+                solutions longer than max_cost.
+    deadline -- optional time.time() value. Raise SearchTimeout if the
+                search is still going then.
+
+    return:
+    Return an (actions, end_state) tuple, same as astar.
+
+    Raise UnsolvableError if start_state can't be solved.
+    """
+    check_solvable(start_state)
+
+    if stats is None:
+        stats = SearchStats()
+
+    targets = frozenset(targets or start_state.shape.tiles)
+    board = MutableGamestate(start_state.grid)
+    actions = []
+    goal_grid = None if goal_state is None else [list(row) for row in goal_state.grid]
+    stats.heuristic_calls += 1
+    h = heuristic(board, targets)
+    threshold = h
+
+    stats.start()
+    try:
+        while True:
+            if max_cost is not None and threshold > max_cost:
+                raise NoSolution()
+
+            if not q:
+                print "threshold =", threshold
+
+            is_solved, next_threshold = ida_helper(board, actions, 0, h, threshold, heuristic, targets, stats,
+                                                   goal_grid=goal_grid, deadline=deadline)
+
+            if is_solved:
+                return actions, type(start_state)(board.grid)
+
+            if next_threshold == float('inf'):
+                raise NoSolution()
+
+            threshold = next_threshold
+    finally:
+        stats.stop()
+
+
+def ida_helper(board, actions_so_far, g, h, threshold, heuristic, targets, stats, prev_blank_loc=None,
+               goal_grid=None, deadline=None):
+    """
+    Recursive helper function for ida_star.
+
+    parameters:
+    board -- MutableGamestate. Moves are made on it in place and unmade
+             before returning, unless a solution is found.
+    actions_so_far -- a list of actions that will take you from the
+                      start_state (given in ida_star) to board.
+    g -- cost so far (number of actions taken)
+    h -- heuristic value of board
+    threshold -- treat nodes with f = g + h above this as leaves
+    heuristic -- see ida_star
+    targets -- see ida_star
+    stats -- SearchStats to count nodes in
+    prev_blank_loc -- location of the blank tile in the parent state.
+    goal_grid -- the grid of ida_star's goal_state as lists, or None
+    deadline -- see ida_star
+
+    Return -- (is_solved, f) tuple. If is_solved is True, board is a goal
+              state and actions_so_far holds the actions to get there.
+              Otherwise f is the smallest f value which exceeded threshold.
+    """
+    f = g + h
+
+    if f > threshold:
+        return False, f
+
+    if board.is_goal_state(targets) if goal_grid is None else board.grid == goal_grid:
+        return True, f
+
+    min_f = float('inf')
+    stats.expanded += 1
+    if stats.callback is not None and stats.expanded % stats.interval == 0:
+        stats.callback(stats)
+
+    if deadline is not None and time.time() > deadline:
+        raise SearchTimeout()
+
+    for action in board.get_legal_actions(prev_blank_loc):
+        undo_action = board.make_move(action)
+        actions_so_far.append(action)
+        stats.generated += 1
+        stats.heuristic_calls += 1
+        successor_h = evaluate(heuristic, board, targets, (h, undo_action))
+        is_solved, next_f = ida_helper(board, actions_so_far, g+1, successor_h, threshold,
+                                       heuristic, targets, stats, undo_action, goal_grid, deadline)
+
+        if is_solved:
+            return is_solved, next_f
+
+        actions_so_far.pop()
+        board.make_move(undo_action)
+        min_f = min(min_f, next_f)
+
+    return False, min_f
@@ -0,0 +1,166 @@
+
+__author__ = "Josh Kelle"
+
+"""
+Caches of solutions, so repeated boards don't have to be solved again.
+
+SolutionCache keeps recently used solutions in memory (LRUCache) and,
+optionally, every solution in a sqlite database on disk.
+"""
+
+from gamestate import pack_grid, board_shape, shape_4x4
+from collections import OrderedDict
+import sqlite3
+
+
+class LRUCache(object):
+
+    """
+    A dict-like cache which holds at most maxsize items, evicting the least
+    recently used item when it's full.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self.items.pop(key)
+        except KeyError:
+            return default
+
+        # move to the most recently used end
+        self.items[key] = value
+        return value
+
+    def put(self, key, value):
+        self.items.pop(key, None)
+        self.items[key] = value
+
+        if len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+
+class SolutionCache(object):
+
+    """
+    Solutions keyed by board and strategy.
+
+    Lookups go to an in-memory LRUCache first, then to the sqlite database
+    at path (if one was given). Hits and misses are counted.
+    """
+
+    def __init__(self, path=None, maxsize=10000):
+        """
+        Contructor
+
+        parameters:
+        path -- sqlite database file, or None to only cache in memory
+        maxsize -- number of solutions to keep in memory
+        """
+        self.memory = LRUCache(maxsize)
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+
+        if path is not None:
+            self.db = sqlite3.connect(path)
+            with self.db:
+                self.db.execute("CREATE TABLE IF NOT EXISTS solutions "
+                                "(key TEXT PRIMARY KEY, actions TEXT NOT NULL)")
+
+    def get(self, gamestate, strategy):
+        """
+        Return the cached list of actions for gamestate, or None.
+
+        parameters:
+        gamestate -- a Gamestate (or anything with a grid)
+        strategy -- a strategy name or a targets_list
+        """
+        key = make_key(gamestate.grid, strategy)
+        actions = self.memory.get(key)
+
+        if actions is None and self.db is not None:
+            row = self.db.execute("SELECT actions FROM solutions WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                actions = decode_actions(row[0], gamestate.shape)
+                self.memory.put(key, actions)
+
+        if actions is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return list(actions)
+
+    def put(self, gamestate, strategy, actions):
+        """
+        Remember actions as the solution to gamestate for strategy.
+        """
+        key = make_key(gamestate.grid, strategy)
+        self.memory.put(key, list(actions))
+
+        if self.db is not None:
+            with self.db:
+                self.db.execute("INSERT OR REPLACE INTO solutions VALUES (?, ?)",
+                                (key, encode_actions(actions, gamestate.shape)))
+
+    def solve(self, gamestate, strategy, solver):
+        """
+        Return the cached solution for gamestate, or call solver(gamestate)
+        and cache what it returns.
+        """
+        actions = self.get(gamestate, strategy)
+
+        if actions is None:
+            actions = solver(gamestate)
+            self.put(gamestate, strategy, actions)
+
+        return actions
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+def make_key(grid, strategy):
+    """
+    Return a string made of the packed board (in hex) and the strategy.
+    strategy is either a name or a targets_list. Boards other than 4 x 4
+    are prefixed with their dimensions.
+    """
+    if not isinstance(strategy, basestring):
+        strategy = ";".join(",".join(map(str, targets)) for targets in strategy)
+
+    key = "%x:%s" % (pack_grid(grid), strategy)
+
+    shape = board_shape(len(grid), len(grid[0]))
+    if shape is not shape_4x4:
+        key = "%dx%d:%s" % (shape.rows, shape.cols, key)
+
+    return key
+
+
+def encode_actions(actions, shape=shape_4x4):
+    """
+    Encode a list of (row, col) actions as a string of board indices in hex,
+    each padded to the same number of digits (one on a 4 x 4 board).
+    """
+    width = len("%x" % (shape.size - 1))
+    return "".join("%0*x" % (width, row * shape.cols + col) for row, col in actions)
+
+
+def decode_actions(text, shape=shape_4x4):
+    """
+    Inverse of encode_actions.
+    """
+    width = len("%x" % (shape.size - 1))
+    return [divmod(int(text[i:i+width], 16), shape.cols) for i in range(0, len(text), width)]
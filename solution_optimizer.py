@@ -0,0 +1,128 @@
+
+__author__ = "Josh Kelle"
+
+"""
+Make solutions shorter after the fact.
+
+Staged solutions (see fifteen_puzzle_ai.solve_astar) are built by gluing
+together the solutions to each stage, so they tend to wander: a stage can
+undo the last moves of the one before it, and the path can come back to a
+board it has already been through. shorten_solution cuts those loops out,
+then re-solves short windows of the path optimally and splices in any
+shorter segment it finds. That gets a lot closer to the optimal length
+than the staged solution, for a small fraction of the cost of an optimal
+search of the whole board.
+"""
+
+import search
+
+
+class WindowBudgetExceeded(Exception):
+    """
+    Raised inside a window's search when it runs out of nodes.
+    """
+    pass
+
+
+def remove_cycles(start_state, actions):
+    """
+    Return actions without the loops: whenever the path comes back to a
+    board it has already been through, the moves in between are dropped.
+    A move followed by its undo is the shortest such loop.
+
+    Boards along the path are indexed in a dict, so this takes linear time.
+    """
+    path = [start_state]
+    kept = []
+    index = {start_state: 0}
+
+    for action in actions:
+        state = path[-1].get_successor(action)
+
+        if state in index:
+            # back to path[index[state]]; forget everything after it
+            cut = index[state]
+            for dropped in path[cut+1:]:
+                del index[dropped]
+            del path[cut+1:]
+            del kept[cut:]
+        else:
+            index[state] = len(path)
+            path.append(state)
+            kept.append(action)
+
+    return kept
+
+
+def shorten_windows(start_state, actions, window=30, max_nodes=50000):
+    """
+    Return actions with windows of the path replaced by shorter ones.
+
+    For every stretch of window moves (windows overlap by half), IDA*
+    looks for a shorter path between the boards at its ends, and splices
+    it in if it finds one. Each window's search gives up after max_nodes
+    expansions, so the whole pass costs at most about
+    2 * len(actions) / window searches of that size.
+    """
+    actions = list(actions)
+    states = _path(start_state, actions)
+    start = 0
+
+    while start < len(actions):
+        end = min(start + window, len(actions))
+        segment = _shortest_segment(states[start], states[end], end - start, max_nodes)
+
+        if segment is not None:
+            actions[start:end] = segment
+            states[start:] = _path(states[start], actions[start:])
+
+        if end == len(actions):
+            break
+        start += max(1, window // 2)
+
+    return actions
+
+
+def shorten_solution(start_state, actions, window=30, max_nodes=50000):
+    """
+    Return a solution from start_state to the same board as actions, which
+    is no longer than actions and usually a good deal shorter. See
+    remove_cycles and shorten_windows.
+    """
+    actions = remove_cycles(start_state, actions)
+    actions = shorten_windows(start_state, actions, window, max_nodes)
+    # spliced segments can make new loops with the rest of the path
+    return remove_cycles(start_state, actions)
+
+
+def _path(start_state, actions):
+    """
+    Return the boards actions go through from start_state, including both
+    ends.
+    """
+    states = [start_state]
+    for action in actions:
+        states.append(states[-1].get_successor(action))
+    return states
+
+
+def _raise_budget_exceeded(stats):
+    raise WindowBudgetExceeded()
+
+
+def _shortest_segment(from_state, to_state, length, max_nodes):
+    """
+    Return a list of actions from from_state to to_state shorter than
+    length, or None if there isn't one or it takes too long to find.
+    """
+    # the two boards' distance has the same parity as length, so a shorter
+    # path is at least 2 moves shorter
+    stats = search.SearchStats(callback=_raise_budget_exceeded, interval=max_nodes)
+
+    try:
+        actions, end_state = search.ida_star(from_state, search.manhattan_to(to_state), q=True, stats=stats,
+                                             goal_state=to_state, max_cost=length - 2)
+    except (search.NoSolution, WindowBudgetExceeded):
+        return None
+
+    return actions
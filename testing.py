@@ -2,8 +2,22 @@
 __author__ = "Josh Kelle"
 
 import unittest
-from gamestate import Gamestate
+import os
+import random
+import shutil
+import tempfile
+from gamestate import Gamestate, PackedGamestate, UnsolvableError
+from pattern_database import PatternDatabase
+from distance_table import DistanceTable
+from gamestate import board_shape
+from priority_queue import BucketPriorityQueue
+from fifteen_puzzle_ai import solve_batch, solve_astar_7breaks, solve_astar, stage_key, solve_staged, solve_adaptive, solve_shortened
+from solution_cache import SolutionCache, LRUCache
 from search import *
+import vectorized
+import ranking
+import benchmark
+import solution_optimizer
 
 """
 Acceptance tests for solving the fifteens puzzle game.
@@ -82,6 +96,500 @@ class Tests(unittest.TestCase):
 
         self.assertTrue(len(actions) <= 20, "actions = %s" % actions)
 
+    def test_astar_optimal(self):
+        start_state = Gamestate([[ 5, 1,16, 3],
+                                 [ 9, 2, 7, 4],
+                                 [ 6, 8,10,12],
+                                 [13,14,11,15]])
+        actions, end_state = astar(start_state, heuristic_linear_conflict, q=True)
+        ida_actions, ida_end_state = ida_star(start_state, heuristic_linear_conflict, q=True)
+
+        self.assertTrue(end_state.is_goal_state())
+        self.assertEqual(len(actions), len(ida_actions))
+
+    def test_bucket_queue(self):
+        fringe = BucketPriorityQueue()
+        for item, priority in [('a', 3), ('b', 1), ('c', 3), ('d', 0)]:
+            fringe.push(item, priority)
+
+        self.assertEqual(len(fringe), 4)
+        self.assertEqual([fringe.pop() for i in range(4)], ['d', 'b', 'c', 'a'])
+        self.assertTrue(fringe.isEmpty())
+
+        start_state = Gamestate([[ 5, 1,16, 3],
+                                 [ 9, 2, 7, 4],
+                                 [ 6, 8,10,12],
+                                 [13,14,11,15]])
+        actions, end_state = astar(start_state, q=True, bucket_queue=True)
+        self.assertTrue(end_state.is_goal_state())
+        self.assertEqual(len(actions), 20)
+
+    def test_astar_budget(self):
+        start_state = Gamestate([[ 5, 1,16, 3],
+                                 [ 9, 2, 7, 4],
+                                 [ 6, 8,10,12],
+                                 [13,14,11,15]])
+        stats = SearchStats()
+        actions, end_state = astar(start_state, q=True, max_nodes=50, stats=stats)
+
+        self.assertTrue(stats.degraded)
+        self.assertTrue(stats.peak_nodes <= 50)
+        self.assertTrue(end_state.is_goal_state())
+        self.assertEqual(len(actions), 20)
+
+        self.assertRaises(SearchBudgetExceeded, astar, start_state, q=True, max_nodes=50,
+                          degrade=False)
+
+        stats = SearchStats()
+        astar(start_state, q=True, max_bytes=10**7, stats=stats)
+        self.assertFalse(stats.degraded)
+
+        # a WalkingDistance h holds its keys, which count towards the budget
+        targets = frozenset(start_state.shape.tiles)
+        self.assertTrue(bytes_per_node(start_state, heuristic_walking_distance(start_state, targets)) >
+                        bytes_per_node(start_state, heuristic_3(start_state, targets)) + 200)
+
+    def test_anytime_astar(self):
+        start_state = Gamestate([[ 5, 1,16, 3],
+                                 [ 9, 2, 7, 4],
+                                 [ 6, 8,10,12],
+                                 [13,14,11,15]])
+        solutions = list(anytime_astar(start_state, heuristic_linear_conflict))
+
+        lengths = [len(actions) for actions, end_state in solutions]
+        self.assertEqual(lengths, sorted(set(lengths), reverse=True))
+        self.assertEqual(lengths[-1], 20)
+
+        self.assertRaises(SearchTimeout, astar, start_state, q=True, deadline=0)
+        self.assertRaises(NoSolution, astar, start_state, q=True, max_cost=19)
+
+        # the weight 2 run misses the 26 move solution, the later ones don't
+        start_state = Gamestate([[16, 2,11, 4],
+                                 [10, 6, 3, 7],
+                                 [ 1, 5,15, 8],
+                                 [ 9,14,13,12]])
+        self.assertRaises(NoSolution, astar, start_state, q=True, weight=2, max_cost=27)
+        # falling back to ida_star keeps the bound and the deadline
+        self.assertRaises(NoSolution, astar, start_state, q=True, max_cost=24, max_nodes=100)
+        self.assertRaises(SearchTimeout, ida_star, start_state, q=True, deadline=0)
+        lengths = [len(actions) for actions, end_state in anytime_astar(start_state)]
+        self.assertEqual(lengths[-1], 26)
+
+    def test_bidirectional_astar(self):
+        start_state = Gamestate([[ 5, 1,16, 3],
+                                 [ 9, 2, 7, 4],
+                                 [ 6, 8,10,12],
+                                 [13,14,11,15]])
+        stats = SearchStats()
+        actions, end_state = bidirectional_astar(start_state, heuristic_linear_conflict, q=True, stats=stats)
+        self.assertTrue(end_state.is_goal_state())
+        self.assertEqual(len(actions), 20)
+        self.assertTrue(0 < stats.expanded <= stats.generated)
+        self.assertTrue(0 < stats.fringe_peak <= stats.peak_nodes)
+        self.assertTrue(stats.heuristic_calls > 0 and stats.seconds > 0)
+
+        state = start_state
+        for action in actions:
+            state = state.get_successor(action)
+        self.assertEqual(state, end_state)
+
+        actions, end_state = bidirectional_astar(end_state, q=True)
+        self.assertEqual(actions, [])
+        self.assertTrue(end_state.is_goal_state())
+
+    def test_ida_star(self):
+        start_state = Gamestate([[ 1,  9,  3,  4],
+                                 [ 5,  2,  6,  7],
+                                 [10, 15, 14,  8],
+                                 [13, 16, 11, 12]])
+        actions, end_state = ida_star(start_state, q=True)
+        astar_actions, astar_end_state = astar(start_state, q=True)
+
+        self.assertTrue(end_state.is_goal_state())
+        self.assertTrue(len(actions) <= len(astar_actions))
+
+        state = start_state
+        for action in actions:
+            state = state.get_successor(action)
+        self.assertEqual(state, end_state)
+
+    def test_pattern_database(self):
+        partition = ((1, 2, 3), (4, 8, 12))
+        directory = tempfile.mkdtemp()
+        try:
+            PatternDatabase.build(partition, directory, q=True)
+            pdb = PatternDatabase.load(directory, partition)
+
+            start_state = Gamestate([[ 1,  9,  3,  4],
+                                     [ 5,  2,  6,  7],
+                                     [10, 15, 14,  8],
+                                     [13, 16, 11, 12]])
+            goal_state = Gamestate([[ 1, 2, 3, 4],
+                                    [ 5, 6, 7, 8],
+                                    [ 9,10,11,12],
+                                    [13,14,15,16]])
+            targets = [1, 2, 3, 4, 8, 12]
+
+            self.assertEqual(pdb(goal_state), 0)
+            self.assertTrue(pdb(start_state, targets) >= heuristic_3(start_state, targets))
+            # only groups entirely within targets count
+            self.assertTrue(pdb(start_state, [1, 2, 3]) <= pdb(start_state, targets))
+
+            actions, end_state = astar(start_state, pdb, targets, q=True)
+            self.assertTrue(end_state.is_goal_state(targets))
+
+            # astar never reopens a state, so no move may change the value by
+            # more than 1, even when the group's tiles wall off the blank
+            start_state = Gamestate([[ 6, 2, 8, 3],
+                                     [ 1,12, 4,15],
+                                     [16, 9,14,11],
+                                     [ 5,13, 7,10]])
+            for action in start_state.get_legal_actions():
+                self.assertTrue(abs(pdb(start_state.get_successor(action)) - pdb(start_state)) <= 1)
+        finally:
+            shutil.rmtree(directory)
+
+        # astar with the pdb finds optimal paths, same as ida_star
+        pdb = PatternDatabase.build(((1, 2, 3, 4), (5, 6, 7, 8)), q=True, shape=board_shape(3, 3))
+        boards = [[[3, 8, 9], [5, 1, 2], [7, 6, 4]]]
+        rng = random.Random(0)
+        while len(boards) < 30:
+            nums = range(1, 10)
+            rng.shuffle(nums)
+            if Gamestate([nums[0:3], nums[3:6], nums[6:9]]).is_solvable():
+                boards.append([nums[0:3], nums[3:6], nums[6:9]])
+        for grid in boards:
+            start_state = Gamestate(grid)
+            self.assertEqual(len(astar(start_state, pdb, q=True)[0]),
+                             len(ida_star(start_state, pdb, q=True)[0]))
+
+    def test_incremental_heuristics(self):
+        start_state = Gamestate([[ 5, 1,16, 3],
+                                 [ 9, 2, 7, 4],
+                                 [ 6, 8,10,12],
+                                 [13,14,11,15]])
+        heuristics = (heuristic_3, heuristic_linear_conflict, heuristic_walking_distance)
+
+        for targets in (range(1,17), [1, 2, 3, 4], [2, 5, 9, 10, 13]):
+            for heuristic in heuristics:
+                h = heuristic(start_state, targets)
+                self.assertTrue(h >= heuristic_3(start_state, targets))
+
+                for action in start_state.get_legal_actions():
+                    successor = start_state.get_successor(action)
+                    self.assertEqual(heuristic(successor, targets, (h, start_state.blank_loc)),
+                                     heuristic(successor, targets))
+
+        for heuristic in heuristics:
+            actions, end_state = ida_star(start_state, heuristic, q=True)
+            self.assertEqual(len(actions), 20)
+
+    def test_unsolvable(self):
+        start_state = Gamestate([[ 1, 2, 3, 4],
+                                 [ 5, 6, 7, 8],
+                                 [ 9,10,11,12],
+                                 [13,15,14,16]])
+        self.assertFalse(start_state.is_solvable())
+        self.assertFalse(PackedGamestate(start_state.grid).is_solvable())
+        self.assertRaises(UnsolvableError, astar, start_state, q=True)
+        self.assertRaises(UnsolvableError, ida_star, start_state, q=True)
+        self.assertRaises(UnsolvableError, iterative_deepening_dfs, start_state, q=True)
+
+        solvable_state = Gamestate([[ 1,  9,  3,  4],
+                                    [ 5,  2,  6,  7],
+                                    [10, 15, 14,  8],
+                                    [13, 16, 11, 12]])
+        self.assertTrue(solvable_state.is_solvable())
+
+    def test_solution_cache(self):
+        start_state = Gamestate([[ 1, 2, 3, 4],
+                                 [ 5,16, 6, 8],
+                                 [ 9,14, 7,11],
+                                 [13,15,10,12]])
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "solutions.db")
+            cache = SolutionCache(path, maxsize=1)
+            actions = solve_astar_7breaks(start_state, cache)
+            self.assertEqual(solve_astar_7breaks(start_state, cache), actions)
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+            cache.close()
+
+            # a new cache finds the solution on disk
+            cache = SolutionCache(path)
+            self.assertEqual(cache.get(start_state, 'anything else'), None)
+            self.assertEqual(solve_astar_7breaks(start_state, cache), actions)
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+            cache.close()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_stage_cache(self):
+        # same places for 1 - 4 and the blank, different other tiles
+        state_1 = Gamestate([[ 2, 1, 3, 5],
+                             [ 4,16, 6, 8],
+                             [ 9,14, 7,11],
+                             [13,15,10,12]])
+        state_2 = Gamestate([[ 2, 1, 3, 9],
+                             [ 4,16,15,14],
+                             [ 5,13,12,11],
+                             [10, 8, 7, 6]])
+        targets_list = [[1, 2, 3, 4]]
+        self.assertEqual(stage_key(state_1, targets_list[0]), stage_key(state_2, targets_list[0]))
+
+        stage_cache = LRUCache()
+        actions = solve_astar(state_1, targets_list + [range(1,17)], stage_cache=stage_cache)
+        self.assertEqual(len(stage_cache), 2)
+
+        state = state_2
+        for action in stage_cache.get(stage_key(state_2, targets_list[0])):
+            state = state.get_successor(action)
+        self.assertTrue(state.is_goal_state(targets_list[0]))
+
+    def test_solve_adaptive(self):
+        start_state = Gamestate([[ 7,14, 1,13],
+                                 [ 4, 5,12,10],
+                                 [ 2, 6, 3, 8],
+                                 [16,15,11, 9]])
+        stats = SearchStats()
+        actions = solve_adaptive(start_state, stage_cache=None, stats=stats)
+        for action in actions:
+            start_state = start_state.get_successor(action)
+        self.assertTrue(start_state.is_goal_state())
+        self.assertEqual(sorted(stats.stages[-1][0]), range(1,17))
+
+        # with no room to merge, the stages are solve_astar_7breaks's
+        stats = SearchStats()
+        solve_adaptive(start_state, stage_cache=None, max_h=-1, stats=stats)
+        self.assertEqual(len(stats.stages), 7)
+
+    def test_solution_optimizer(self):
+        start_state = Gamestate([[ 5, 1,16, 3],
+                                 [ 9, 2, 7, 4],
+                                 [ 6, 8,10,12],
+                                 [13,14,11,15]])
+        actions = astar(start_state, q=True)[0]
+
+        # a detour: move the blank around a 2 x 2 square and back
+        blank_row, blank_col = start_state.blank_loc
+        detour = [(blank_row, blank_col - 1), (blank_row + 1, blank_col - 1),
+                  (blank_row + 1, blank_col), (blank_row, blank_col)]
+        detour += [(blank_row + 1, blank_col), (blank_row + 1, blank_col - 1),
+                   (blank_row, blank_col - 1), (blank_row, blank_col)]
+        self.assertEqual(solution_optimizer.remove_cycles(start_state, detour + actions), actions)
+
+        # a staged solution, shortened to the optimal length
+        targets_list = [[1, 2], [1, 2, 3, 4], range(1,17)]
+        staged_actions = solve_astar(start_state, targets_list, stage_cache=None)
+        shortened = solution_optimizer.shorten_solution(start_state, staged_actions)
+        self.assertTrue(len(staged_actions) > len(actions))
+        self.assertEqual(len(shortened), len(actions))
+        for action in shortened:
+            start_state = start_state.get_successor(action)
+        self.assertTrue(start_state.is_goal_state())
+
+        start_state = Gamestate([[ 7, 3,16,15],
+                                 [ 6, 5, 4,10],
+                                 [ 2,11,14,13],
+                                 [ 9, 1,12, 8]])
+        segment = ida_star(start_state, manhattan_to(start_state.get_successor((0, 3))), q=True,
+                           goal_state=start_state.get_successor((0, 3)))[0]
+        self.assertEqual(segment, [(0, 3)])
+
+        # solutions found with different settings are cached apart
+        start_state = Gamestate([[ 1, 2, 3, 4],
+                                 [ 5,16, 6, 8],
+                                 [ 9,14, 7,11],
+                                 [13,15,10,12]])
+        cache = SolutionCache()
+        solve_shortened(start_state, cache, max_h=-1, stage_cache=None)
+        self.assertTrue(cache.get(start_state, "shortened:20000:-1") is not None)
+        self.assertTrue(cache.get(start_state, "shortened:20000:10") is None)
+
+    def test_solve_batch(self):
+        boards = [[[ 1, 2, 3, 4], [ 5,16, 6, 8], [ 9,14, 7,11], [13,15,10,12]],
+                  [[ 1, 2, 3, 4], [ 5, 6, 7, 8], [ 9,10,11,12], [13,15,14,16]],
+                  [[14,16, 4, 9], [13, 2, 7,12], [ 3, 1, 6, 8], [10,15, 5,11]]]
+        results = sorted(solve_batch(boards, 'optimal', processes=2, timeout=0.5))
+
+        self.assertEqual([result.index for result in results], [0, 1, 2])
+        self.assertEqual(len(results[0].actions), 8)
+        self.assertTrue(results[1].error.startswith("UnsolvableError"))
+        self.assertTrue(results[2].actions is None and "timed out" in results[2].error)
+
+    def test_packed_gamestate(self):
+        grid = [[ 1,  9,  3,  4],
+                [ 5,  2,  6,  7],
+                [10, 15, 14,  8],
+                [13, 16, 11, 12]]
+        state = Gamestate(grid)
+        packed = PackedGamestate(grid)
+
+        self.assertEqual(packed.grid, state.grid)
+        self.assertEqual(packed.blank_loc, state.blank_loc)
+        # they hash differently, so they mustn't compare equal
+        self.assertFalse(packed == state or state == packed)
+        self.assertEqual(len(set([packed, state, PackedGamestate(grid), Gamestate(grid)])), 2)
+        self.assertEqual(packed.get_legal_actions(), state.get_legal_actions())
+        for action in state.get_legal_actions():
+            self.assertEqual(packed.get_successor(action).grid,
+                             state.get_successor(action).grid)
+
+        actions, end_state = astar(packed, q=True)
+        self.assertTrue(type(end_state) is PackedGamestate)
+        self.assertTrue(end_state.is_goal_state())
+
+    def test_legal_actions_exclude(self):
+        state = Gamestate([[ 1, 2, 3, 4],
+                           [ 5,16, 6, 8],
+                           [ 9,14, 7,11],
+                           [13,15,10,12]])
+        self.assertEqual(state.get_legal_actions(), [(0,1),(1,0),(1,2),(2,1)])
+        self.assertEqual(state.get_legal_actions((1,2)), [(0,1),(1,0),(2,1)])
+        for action in state.get_legal_actions():
+            self.assertEqual(state.get_successor(action).blank_loc, action)
+        is_solved, actions = dls(state, 8)
+        self.assertTrue(is_solved)
+        self.assertEqual(len(actions), 8)
+
+    def test_other_board_sizes(self):
+        start_state = Gamestate([[8, 6, 7],
+                                 [2, 5, 4],
+                                 [3, 9, 1]])
+        self.assertTrue(start_state.is_solvable())
+        self.assertFalse(Gamestate([[2, 1, 3], [4, 5, 6], [7, 8, 9]]).is_solvable())
+
+        for heuristic in (heuristic_3, heuristic_linear_conflict, heuristic_walking_distance):
+            actions, end_state = astar(start_state, heuristic, q=True)
+            self.assertEqual(len(actions), 31)
+            self.assertEqual(len(ida_star(start_state, heuristic, q=True)[0]), 31)
+            self.assertEqual(end_state.grid, ((1, 2, 3), (4, 5, 6), (7, 8, 9)))
+
+        packed_state = PackedGamestate(start_state.grid)
+        self.assertEqual(len(astar(packed_state, q=True)[0]), 31)
+
+        start_state = Gamestate([[ 1, 2, 3, 4, 5],
+                                 [ 6, 7, 8, 9,10],
+                                 [11,12,25,14,15],
+                                 [16,17,13,19,20],
+                                 [21,22,18,23,24]])
+        actions = solve_staged(start_state)
+        for action in actions:
+            start_state = start_state.get_successor(action)
+        self.assertTrue(start_state.is_goal_state())
+
+    def test_distance_table(self):
+        table = DistanceTable.build(range(1,7), board_shape(2, 3), q=True)
+        start_state = Gamestate([[5, 3, 6],
+                                 [1, 2, 4]])
+        actions, end_state = table.solve(start_state)
+        self.assertTrue(end_state.is_goal_state())
+        self.assertEqual(len(actions), len(astar(start_state, q=True)[0]))
+        self.assertRaises(UnsolvableError, table.distance, Gamestate([[2, 1, 3], [4, 5, 6]]))
+
+        start_state = Gamestate([[ 5, 1,16, 3],
+                                 [ 9, 2, 7, 4],
+                                 [ 6, 8,10,12],
+                                 [13,14,11,15]])
+        table = DistanceTable.build([1, 2], q=True)
+        self.assertEqual(table(start_state, [1, 2, 3]), len(astar(start_state, targets=[1, 2], q=True)[0]))
+        self.assertEqual(table(start_state, [1, 3]), 0)
+
+        targets_list = [[1, 2], range(1,17)]
+        actions = solve_astar(start_state, targets_list, stage_cache=None, tables={(1, 2): table})
+        self.assertEqual(actions, solve_astar(start_state, targets_list, stage_cache=None))
+
+    def test_ranking(self):
+        for rank in range(24):
+            self.assertEqual(ranking.rank_permutation(ranking.unrank_permutation(rank, 4)), rank)
+        placements = [ranking.unrank_placement(rank, 3, 6) for rank in range(ranking.num_placements(3, 6))]
+        self.assertEqual(placements, sorted(placements))
+        self.assertEqual([ranking.rank_placement(placement, 6) for placement in placements], range(len(placements)))
+
+        start_state = Gamestate([[ 5, 1,16, 3],
+                                 [ 9, 2, 7, 4],
+                                 [ 6, 8,10,12],
+                                 [13,14,11,15]])
+        self.assertEqual(Gamestate(ranking.unrank_board(ranking.rank_board(start_state))), start_state)
+
+        targets = [1, 2, 3, 4]
+        actions, end_state = astar(start_state, targets=targets, q=True, dense=True)
+        self.assertTrue(end_state.is_goal_state(targets))
+        self.assertEqual(len(actions), len(astar(start_state, targets=targets, q=True)[0]))
+
+    def test_search_stats(self):
+        start_state = Gamestate([[ 5, 1,16, 3],
+                                 [ 9, 2, 7, 4],
+                                 [ 6, 8,10,12],
+                                 [13,14,11,15]])
+        reports = []
+        stats = SearchStats(callback=lambda stats: reports.append(stats.expanded), interval=5)
+        astar(start_state, q=True, stats=stats)
+        self.assertEqual(reports, range(5, stats.expanded + 1, 5))
+        self.assertTrue(0 < stats.deduplicated < stats.heuristic_calls <= stats.generated + 1)
+        self.assertTrue(0 < stats.fringe_peak <= stats.peak_nodes)
+        self.assertTrue(stats.seconds > 0 and stats.expansions_per_second() > 0)
+
+        stats = SearchStats()
+        ida_star(start_state, q=True, stats=stats)
+        dls(start_state, 6, stats=stats)
+        self.assertTrue(stats.generated >= stats.expanded > 0)
+
+        stats = SearchStats()
+        targets_list = [[1, 2], range(1,17)]
+        solve_astar(start_state, targets_list, stage_cache=None, stats=stats)
+        self.assertEqual([targets for targets, seconds in stats.stages], map(tuple, targets_list))
+        self.assertEqual(sorted(stats.as_dict()['stages'][0]), ['seconds', 'targets'])
+
+    def test_benchmark(self):
+        korf_goal = benchmark.korf_gamestate(range(16))
+        self.assertTrue(korf_goal.is_goal_state())
+
+        corpus = benchmark.scramble_corpus(depths=(10, 20), count=1, seed=1)
+        self.assertEqual(corpus, benchmark.scramble_corpus(depths=(10, 20), count=1, seed=1))
+
+        results = benchmark.run(corpus, ['astar_manhattan', 'solve_astar_7breaks'], q=True)
+        self.assertEqual(len(results['runs']), 4)
+        for run in results['runs']:
+            self.assertEqual(run['error'], None)
+            self.assertTrue(run['expanded'] > 0 and run['generated'] >= run['expanded'])
+        self.assertEqual(results['summary']['astar_manhattan']['solved'], 2)
+        self.assertEqual(benchmark.compare(results, results), [])
+
+        worse = dict(results, runs=[dict(run, length=run['length'] * 2) for run in results['runs']])
+        self.assertEqual(len(benchmark.compare(worse, results)), 2)
+
+    @unittest.skipIf(vectorized.np is None, "numpy isn't installed")
+    def test_vectorized(self):
+        states = [Gamestate([[ 5, 1,16, 3],
+                             [ 9, 2, 7, 4],
+                             [ 6, 8,10,12],
+                             [13,14,11,15]]),
+                  Gamestate([[ 1, 9, 3, 4],
+                             [ 5, 2, 6, 7],
+                             [10,15,14, 8],
+                             [13,16,11,12]])]
+        boards = vectorized.boards_to_array(states)
+        self.assertEqual(vectorized.array_to_gamestates(boards), states)
+
+        targets = [1, 2, 3, 4, 5]
+        self.assertEqual(list(vectorized.manhattan_batch(boards)), [heuristic_3(state, range(1,17)) for state in states])
+        self.assertEqual(list(vectorized.manhattan_batch(boards, targets)), [heuristic_3(state, targets) for state in states])
+
+        children, parents, actions = vectorized.expand_batch(boards)
+        expected = [state.get_successor(action) for state in states for action in state.get_legal_actions()]
+        self.assertEqual(vectorized.array_to_gamestates(children), expected)
+
+        reports = []
+        stats = SearchStats(callback=lambda stats: reports.append(stats.expanded), interval=50)
+        actions, end_state = vectorized.beam_search(states[0], width=100, stats=stats)
+        self.assertTrue(end_state.is_goal_state())
+        self.assertTrue(0 < stats.expanded <= stats.generated and stats.fringe_peak <= 100)
+        self.assertTrue(0 < len(reports) <= stats.expanded // 50)
+        for action in actions:
+            states[0] = states[0].get_successor(action)
+        self.assertEqual(states[0], end_state)
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,261 @@
+
+__author__ = "Josh Kelle"
+
+"""
+Heuristics and successor generation for many boards at once, with NumPy.
+
+A batch of boards is a uint8 array of shape (N, rows * cols). Each row of
+the array is one board: its tile numbers in row-major order. The functions
+here work on the whole batch with a few array operations, rather than a
+Python loop per board, which is what scoring lots of scrambled boards or
+expanding a whole layer of a beam search wants.
+
+NumPy is only needed by this module.
+"""
+
+from gamestate import Gamestate, shape_4x4, check_solvable
+import search
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("vectorized needs numpy, which isn't installed")
+
+
+def boards_to_array(gamestates, shape=None):
+    """
+    Return a (N, rows * cols) uint8 array holding the boards of gamestates.
+
+    parameters:
+    gamestates -- a list of Gamestates (or anything with a grid)
+    shape -- the boards' BoardShape. Defaults to the first board's shape.
+    """
+    _require_numpy()
+
+    gamestates = list(gamestates)
+    if shape is None:
+        shape = gamestates[0].shape if gamestates else shape_4x4
+
+    boards = np.empty((len(gamestates), shape.size), dtype=np.uint8)
+    for i, gamestate in enumerate(gamestates):
+        boards[i] = [num for row in gamestate.grid for num in row]
+
+    return boards
+
+
+def array_to_gamestates(boards, shape=shape_4x4):
+    """
+    Inverse of boards_to_array.
+    """
+    return [Gamestate(board.reshape(shape.rows, shape.cols).tolist(), shape) for board in boards]
+
+
+_distance_tables = {}
+
+def distance_table(targets, shape=shape_4x4):
+    """
+    Return a (rows * cols + 1, rows * cols) array whose [num, index] entry
+    is the manhattan distance from board index index to tile num's correct
+    location, or 0 if num isn't in targets. The blank always counts 0.
+    Tables are built once and cached.
+    """
+    _require_numpy()
+
+    key = (frozenset(targets), shape)
+    if key in _distance_tables:
+        return _distance_tables[key]
+
+    table = np.zeros((shape.size + 1, shape.size), dtype=np.uint8)
+    for num in targets:
+        if num == shape.blank:
+            continue
+
+        goal_row, goal_col = shape.correct_locations[num]
+        for index in range(shape.size):
+            row, col = divmod(index, shape.cols)
+            table[num, index] = abs(row - goal_row) + abs(col - goal_col)
+
+    _distance_tables[key] = table
+    return table
+
+
+def manhattan_batch(boards, targets=None, shape=shape_4x4):
+    """
+    heuristic_3 for every board in boards.
+
+    parameters:
+    boards -- a (N, rows * cols) array, see boards_to_array
+    targets -- tiles which count towards the heuristic. Defaults to every tile.
+
+    return:
+    Return an int32 array of N heuristic values.
+    """
+    table = distance_table(targets or shape.tiles, shape)
+    return table[boards, np.arange(shape.size)].sum(axis=1, dtype=np.int32)
+
+
+_move_tables = {}
+
+def move_table(shape=shape_4x4):
+    """
+    Return a (rows * cols, 4) int array. Row i holds the board indices next
+    to board index i, in row-major order, padded with -1.
+    """
+    _require_numpy()
+
+    if shape not in _move_tables:
+        table = np.full((shape.size, 4), -1, dtype=np.int32)
+        for index, locations in enumerate(shape.neighbor_table):
+            table[index, :len(locations)] = [row * shape.cols + col for row, col in locations]
+        _move_tables[shape] = table
+
+    return _move_tables[shape]
+
+
+def expand_batch(boards, shape=shape_4x4, prev_blanks=None):
+    """
+    Generate the successors of every board in boards.
+
+    parameters:
+    boards -- a (N, rows * cols) array, see boards_to_array
+    prev_blanks -- optional array of N board indices: where each board's
+                   blank was in its parent. The move back there is skipped,
+                   same as get_legal_actions(exclude). -1 skips nothing.
+
+    return:
+    Return a (children, parents, actions) tuple of arrays. children[i] is
+    a successor of boards[parents[i]], made by clicking the tile at board
+    index actions[i]. Successors of the same board are in row-major order
+    of their actions.
+    """
+    blanks = (boards == shape.blank).argmax(axis=1)
+    moves = move_table(shape)[blanks]
+
+    valid = moves >= 0
+    if prev_blanks is not None:
+        valid &= moves != np.asarray(prev_blanks)[:, None]
+
+    parents, directions = np.nonzero(valid)
+    actions = moves[parents, directions]
+
+    children = boards[parents]
+    rows = np.arange(len(parents))
+    children[rows, blanks[parents]] = children[rows, actions]
+    children[rows, actions] = shape.blank
+
+    return children, parents, actions
+
+
+def beam_search(start_gamestate, width=1000, targets=None, max_depth=1000, stats=None):
+    """
+    Beam search, one vectorized layer at a time.
+
+    Every board in the current layer is expanded at once, duplicates within
+    the new layer are dropped, and only the width boards with the smallest
+    heuristic_3 values are kept. Wider beams find shorter solutions but
+    take longer. Solutions aren't optimal, and the search can fail even on
+    a solvable board if the beam is too narrow.
+
+    parameters:
+    start_gamestate -- a Gamestate object
+    width -- number of boards kept per layer
+    targets -- tiles which need to be in the correct spot. Defaults to
+               every tile.
+    max_depth -- give up after this many layers
+    stats -- optional search.SearchStats to fill in. Every board in a
+             layer counts as expanded, the beam is the fringe, and each
+             board scored counts as a heuristic call. The callback is
+             called after a layer whenever expanded has passed another
+             multiple of interval.
+
+    return:
+    Return an (actions, end_state) tuple, same as search.astar.
+
+    Raise UnsolvableError if start_gamestate can't be solved, and
+    search.NoSolution if no solution is found within max_depth moves.
+    """
+    _require_numpy()
+    check_solvable(start_gamestate)
+
+    if stats is None:
+        stats = search.SearchStats()
+
+    stats.start()
+    try:
+        return _beam_search(start_gamestate, width, targets, max_depth, stats)
+    finally:
+        stats.stop()
+
+
+def _beam_search(start_gamestate, width, targets, max_depth, stats):
+    """
+    The search loop of beam_search. beam_search checks the arguments and
+    times it.
+    """
+    shape = start_gamestate.shape
+    targets = list(targets or shape.tiles)
+    goal_indices = [row * shape.cols + col for row, col in (shape.correct_locations[num] for num in targets)]
+
+    boards = boards_to_array([start_gamestate], shape)
+    prev_blanks = np.array([-1])
+    history = []
+
+    for depth in range(max_depth + 1):
+        stats.fringe_peak = max(stats.fringe_peak, len(boards))
+        stats.peak_nodes = max(stats.peak_nodes, len(boards))
+
+        solved = np.nonzero((boards[:, goal_indices] == targets).all(axis=1))[0]
+        if len(solved):
+            return _beam_actions(history, solved[0], shape), array_to_gamestates(boards[solved[:1]], shape)[0]
+
+        if depth == max_depth:
+            break
+
+        blanks = (boards == shape.blank).argmax(axis=1)
+        children, parents, actions = expand_batch(boards, shape, prev_blanks)
+        num_generated = len(children)
+
+        children, first = np.unique(children, axis=0, return_index=True)
+        parents, actions = parents[first], actions[first]
+
+        prev_expanded = stats.expanded
+        stats.expanded += len(boards)
+        stats.generated += num_generated
+        stats.deduplicated += num_generated - len(children)
+
+        if len(children) > width:
+            heuristic_start = time.time()
+            h = manhattan_batch(children, targets, shape)
+            stats.heuristic_seconds += time.time() - heuristic_start
+            stats.heuristic_calls += len(children)
+            keep = np.argsort(h, kind='mergesort')[:width]
+            children, parents, actions = children[keep], parents[keep], actions[keep]
+
+        if stats.callback is not None and stats.expanded // stats.interval > prev_expanded // stats.interval:
+            stats.callback(stats)
+
+        history.append((parents, actions))
+        boards = children
+        prev_blanks = blanks[parents]
+
+    raise search.NoSolution()
+
+
+def _beam_actions(history, index, shape):
+    """
+    Follow parent indices back through beam_search's layers from board
+    index of the last layer. Return the list of actions that led to it.
+    """
+    actions = []
+    for parents, layer_actions in reversed(history):
+        actions.append(divmod(int(layer_actions[index]), shape.cols))
+        index = parents[index]
+
+    actions.reverse()
+    return actions